@@ -0,0 +1,627 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+"""
+性能测试：python benchmark.py
+用 example.pptx 的第0页幻灯片复制出几百页的大模板，对比各种渲染方式的耗时
+"""
+import io
+import re
+import copy
+import sys
+import time
+import zipfile
+import subprocess
+
+from pptx import Presentation
+from pptx.table import _Cell
+from pptx.util import Inches
+
+import pptxtpl
+import pptx_package
+import slide_copy
+import image_cache
+
+
+def get_replace_data():
+    return {"{name0}": "zzz", "{age0}": 90, "{name1}": "wb", "{age1}": 45, "{name2}": "zb", "{age2}": 18,
+            "{student_number}": 3}
+
+
+def build_large_template(slide_count, source_path="./example.pptx"):
+    """
+    将 example.pptx 的第0页复制 slide_count 次，得到一个大模板
+    :return: 模板的 bytes
+    """
+    pptx_obj = pptxtpl.PPTXTemplate(source_path)
+    for _ in range(slide_count - 1):
+        pptx_obj.pptx_copy_slide(0, 1)
+
+    return pptx_obj.save()
+
+
+def build_many_slides_template(slide_count, source_path="./example.pptx"):
+    """
+    直接改写 zip，生成 slide_count 页都是 example.pptx 第0页副本的模板
+    python-pptx 逐页 add_slide 是 O(n²) 的，几千页时太慢
+    :return: 模板的 bytes
+    """
+    with zipfile.ZipFile(source_path) as source:
+        members = dict((name, source.read(name)) for name in source.namelist())
+
+    slide_xml = members["ppt/slides/slide1.xml"]
+    slide_rels = members["ppt/slides/_rels/slide1.xml.rels"]
+    for name in list(members):
+        if name.startswith("ppt/slides/"):
+            del members[name]
+
+    slide_reltype = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/slide"
+    presentation_rels = re.sub(r'<Relationship [^>]*Type="%s"[^>]*/>' % re.escape(slide_reltype), "",
+                               members["ppt/_rels/presentation.xml.rels"].decode("utf-8"))
+    presentation_rels = presentation_rels.replace("</Relationships>", "".join(
+        '<Relationship Id="rIdS%d" Type="%s" Target="slides/slide%d.xml"/>' % (i, slide_reltype, i)
+        for i in range(1, slide_count + 1)) + "</Relationships>")
+
+    sld_id_lst = "".join('<p:sldId id="%d" r:id="rIdS%d"/>' % (255 + i, i) for i in range(1, slide_count + 1))
+    presentation = re.sub(r"<p:sldIdLst>.*?</p:sldIdLst>", "<p:sldIdLst>%s</p:sldIdLst>" % sld_id_lst,
+                          members["ppt/presentation.xml"].decode("utf-8"))
+
+    slide_content_type = "application/vnd.openxmlformats-officedocument.presentationml.slide+xml"
+    content_types = members["[Content_Types].xml"].decode("utf-8").replace("</Types>", "".join(
+        '<Override PartName="/ppt/slides/slide%d.xml" ContentType="%s"/>' % (i, slide_content_type)
+        for i in range(1, slide_count + 1)) + "</Types>")
+
+    members["ppt/_rels/presentation.xml.rels"] = presentation_rels.encode("utf-8")
+    members["ppt/presentation.xml"] = presentation.encode("utf-8")
+    members["[Content_Types].xml"] = content_types.encode("utf-8")
+    for i in range(1, slide_count + 1):
+        members["ppt/slides/slide%d.xml" % i] = slide_xml
+        members["ppt/slides/_rels/slide%d.xml.rels" % i] = slide_rels
+
+    stream = io.BytesIO()
+    with zipfile.ZipFile(stream, "w", zipfile.ZIP_DEFLATED) as target:
+        for name, blob in members.items():
+            target.writestr(name, blob)
+    return stream.getvalue()
+
+
+def timeit(func, setup=None, repeat=5):
+    """
+    返回 func 多次执行中最快的一次耗时(毫秒)
+    :param setup: 不计时的准备工作，返回值作为 func 的参数
+    """
+    best = None
+    for _ in range(repeat):
+        args = (setup(),) if setup else ()
+        start = time.perf_counter()
+        func(*args)
+        cost = (time.perf_counter() - start) * 1000
+        best = cost if best is None else min(best, cost)
+    return best
+
+
+def benchmark_replace_data(slide_count=300):
+    template_blob = build_large_template(slide_count)
+    data = get_replace_data()
+    compiled_template = pptxtpl.CompiledTemplate(io.BytesIO(template_blob))
+
+    def load():
+        return pptxtpl.PPTXTemplate(io.BytesIO(template_blob))
+
+    def render(method_name):
+        def func(pptx_obj):
+            replace = getattr(pptx_obj, method_name)
+            for index in range(slide_count):
+                replace(index, data)
+        return func
+
+    # 渲染的耗时不包含模板解析
+    results = [
+        ("parse template", lambda: load(), None),
+        ("compiled new_template", compiled_template.new_template, None),
+        ("replace_data (build index)", render("replace_data"), load),
+        ("replace_data (compiled index)", render("replace_data"), compiled_template.new_template),
+        ("replace_data_xml", render("replace_data_xml"), load),
+    ]
+
+    print("replace_data: %d slides" % slide_count)
+    for name, func, setup in results:
+        print("  %-32s %8.1f ms" % (name, timeit(func, setup)))
+
+
+def benchmark_substitute(label_count=2000):
+    """
+    一段文本中含有大量标签时，逐个 str.replace 与 LabelFormat.substitute 一次扫描的对比
+    """
+    label_format = pptxtpl.LabelFormat()
+    data = dict((label_format.label_format % ("name%d" % i), "value%d" % i) for i in range(label_count))
+    text = " ".join(data.keys())
+
+    def replace_one_by_one():
+        result = text
+        for label in label_format.pattern.findall(result):
+            if label in data:
+                result = result.replace(label, str(data[label]))
+        return result
+
+    assert replace_one_by_one() == label_format.substitute(text, data)
+
+    print("substitute: %d labels in one text" % label_count)
+    print("  %-32s %8.1f ms" % ("findall + str.replace", timeit(replace_one_by_one)))
+    print("  %-32s %8.1f ms" % ("LabelFormat.substitute", timeit(lambda: label_format.substitute(text, data))))
+
+
+def benchmark_chart(render_count=50):
+    """
+    统计图数据替换：立即生成内嵌xlsx、延迟到保存时生成、不生成的对比
+    """
+    compiled_template = pptxtpl.CompiledTemplate("./example.pptx")
+    title_data = {"{grade_title}": {"category": ["不及格", "及格", "良好", "优秀"],
+                                    "data": {"一班": [3, 20, 15, 7], "二班": [2, 18, 20, 5], "三班": [4, 22, 10, 9]}}}
+    title_replace = {"{grade_title}": "各班成绩分布"}
+
+    def render(workbook, save):
+        def func():
+            for _ in range(render_count):
+                pptx_obj = compiled_template.new_template()
+                pptx_obj.replace_bar_chart_data(1, title_data, title_replace, workbook)
+                if save:
+                    pptx_obj.save(io.BytesIO())
+        return func
+
+    print("chart: %d renders" % render_count)
+    for workbook in (pptxtpl.CHART_WORKBOOK_NOW, pptxtpl.CHART_WORKBOOK_LAZY, pptxtpl.CHART_WORKBOOK_SKIP):
+        print("  %-32s %8.1f ms" % ("replace (%s)" % workbook, timeit(render(workbook, False), repeat=3)))
+    for workbook in (pptxtpl.CHART_WORKBOOK_NOW, pptxtpl.CHART_WORKBOOK_LAZY, pptxtpl.CHART_WORKBOOK_SKIP):
+        print("  %-32s %8.1f ms" % ("replace + save (%s)" % workbook, timeit(render(workbook, True), repeat=3)))
+
+
+def benchmark_table_texts(row_count=100000):
+    """
+    DataFrame 转表格文本：逐个单元格 str() 与按列向量化格式化的对比
+    """
+    import numpy as np
+    import pandas as pd
+    import frame_data
+
+    df = pd.DataFrame({"id": np.arange(row_count), "score": np.random.rand(row_count) * 100,
+                       "rank": np.random.rand(row_count)})
+    df.loc[::7, "score"] = np.nan
+
+    def per_cell():
+        return [["" if value != value else "%.2f" % value if isinstance(value, float) else str(value)
+                 for value in row] for row in df.itertuples(index=False)]
+
+    print("table texts: %d rows" % row_count)
+    print("  %-32s %8.1f ms" % ("per cell str()", timeit(per_cell, repeat=3)))
+    print("  %-32s %8.1f ms" % ("frame_data.get_table_texts",
+                                 timeit(lambda: frame_data.get_table_texts(df, {"score": "%.2f", "rank": "%.2f"}),
+                                        repeat=3)))
+
+
+def benchmark_table_rows(row_count=5000):
+    """
+    表格增长到 row_count 行：逐行复制 a:tr 后用 _Cell 逐个单元格重建文本，与复制预建好 run 的原型行直接写文本的对比
+    """
+    rows = [[i, "name%d" % i, i * 1.5] for i in range(row_count)]
+
+    def load():
+        return pptxtpl.PPTXTemplate("./example.pptx")
+
+    def per_cell(pptx_obj):
+        table = pptx_obj.get_slide_table_shape(0).table
+        tbl = table._tbl
+        last_tr = tbl.tr_lst[-1]
+        for row in rows:
+            tr = copy.deepcopy(last_tr)
+            tbl.append(tr)
+            for tc, value in zip(tr.tc_lst, row):
+                cell = _Cell(tc, table)
+                cell.text_frame.clear()
+                cell.text_frame.paragraphs[0].add_run().text = str(value)
+
+    print("table rows: %d rows" % row_count)
+    print("  %-32s %8.1f ms" % ("copy row + _Cell text", timeit(per_cell, load, repeat=3)))
+    print("  %-32s %8.1f ms" % ("add_table_data", timeit(lambda pptx_obj: pptx_obj.add_table_data(0, rows),
+                                                          load, repeat=3)))
+
+
+def benchmark_reorder(slide_count=2000):
+    """
+    几千页的模板：逐页 move_slide/delete_slide 与一次性 reorder_slides/keep_slides 的对比
+    """
+    template_blob = build_many_slides_template(slide_count)
+    kept = list(range(0, slide_count, 10))
+
+    def load():
+        return pptxtpl.PPTXTemplate(io.BytesIO(template_blob))
+
+    def reverse_one_by_one(pptx_obj):
+        for index in range(slide_count):
+            pptx_obj.move_slide(slide_count - 1, index)
+
+    def delete_one_by_one(pptx_obj):
+        kept_set = set(kept)
+        for index in reversed(range(slide_count)):
+            if index not in kept_set:
+                pptx_obj.delete_slide(index)
+
+    results = [
+        ("reverse: move_slide per slide", reverse_one_by_one),
+        ("reverse: reorder_slides", lambda pptx_obj: pptx_obj.reorder_slides(range(slide_count - 1, -1, -1))),
+        ("keep 10%: delete_slide per slide", delete_one_by_one),
+        ("keep 10%: keep_slides", lambda pptx_obj: pptx_obj.keep_slides(kept)),
+    ]
+
+    print("reorder: %d slides" % slide_count)
+    for name, func in results:
+        print("  %-32s %8.1f ms" % (name, timeit(func, load, repeat=3)))
+
+
+def build_grouped_template(group_count=50, depth=3, shapes_per_group=4):
+    """
+    一页幻灯片上有 group_count 个嵌套 depth 层的组合图形，每层有 shapes_per_group 个文本框
+    """
+    prs = Presentation()
+    slide = prs.slides.add_slide(prs.slide_layouts[6])
+    for i in range(group_count):
+        group_shapes = slide.shapes
+        for level in range(depth):
+            group_shapes = group_shapes.add_group_shape().shapes
+            for j in range(shapes_per_group):
+                group_shapes.add_textbox(0, 0, Inches(1), Inches(1)).text = "red" if j == 0 else "{g%d_%d_%d}" % (i, level, j)
+    stream = io.BytesIO()
+    prs.save(stream)
+    return stream.getvalue()
+
+
+def benchmark_single_shapes(call_count=20):
+    """
+    同一页幻灯片上重复调用 get_slide_single_shapes (set_background_color 等方法都会调用)：
+    每次递归展开组合图形与使用缓存的对比
+    """
+    template_blob = build_grouped_template()
+
+    def load():
+        return pptxtpl.PPTXTemplate(io.BytesIO(template_blob))
+
+    def uncached(pptx_obj):
+        for _ in range(call_count):
+            pptx_obj.invalidate_shape_cache()
+            pptx_obj.get_slide_single_shapes(0)
+
+    def cached(pptx_obj):
+        for _ in range(call_count):
+            pptx_obj.get_slide_single_shapes(0)
+
+    print("single shapes: %d calls, %d shapes" % (call_count, len(load().get_slide_single_shapes(0))))
+    print("  %-32s %8.1f ms" % ("walk every call", timeit(uncached, load)))
+    print("  %-32s %8.1f ms" % ("cached shape list", timeit(cached, load)))
+
+
+def benchmark_prune(slide_count=300):
+    """
+    渲染之后删除还有替换标签的图形(通常的用法：大部分标签已经渲染，只删除没有数据的图形)
+    模板是 example.pptx 的文本页和统计图页交替复制，文本页缺少 {age2} 的数据，统计图页的标题已经替换
+    逐个 shape 用 python-pptx 代理对象检查(读取每个统计图的 chart_title)，
+    与每页一次XPath筛选、统计图标题直接读取xml的 delete_shapes_in_pptx 的对比
+    """
+    pptx_obj = pptxtpl.PPTXTemplate("./example.pptx")
+    for i in range(slide_count - 2):
+        pptx_obj.clone_slide(i % 2, len(pptx_obj.presentation.slides))
+    template_blob = pptx_obj.save()
+
+    data = get_replace_data()
+    del data["{age2}"]
+    title_data = {"{grade_title}": {"category": ["不及格", "及格"], "data": {"一班": [20, 80]}}}
+
+    def load():
+        pptx_obj = pptxtpl.PPTXTemplate(io.BytesIO(template_blob))
+        for index in range(slide_count):
+            if index % 2 == 0:
+                pptx_obj.replace_data(index, data)
+            else:
+                pptx_obj.replace_bar_chart_data(index, title_data, {"{grade_title}": "一班及格人数柱状图"},
+                                                pptxtpl.CHART_WORKBOOK_SKIP)
+        return pptx_obj
+
+    def proxy_walk(pptx_obj):
+        for slide in pptx_obj.presentation.slides:
+            elements = []
+            for shape in slide.shapes:
+                if shape.has_text_frame and pptx_obj.is_contain_replace_label(shape.text_frame.text.strip()):
+                    elements.append(shape._element)
+                elif shape.has_chart and shape.chart.has_title and \
+                        pptx_obj.is_contain_replace_label(shape.chart.chart_title.text_frame.text):
+                    elements.append(shape._element)
+            for element in elements:
+                slide.shapes._spTree.remove(element)
+
+    print("prune: %d rendered slides, half with charts" % slide_count)
+    print("  %-32s %8.1f ms" % ("python-pptx shape walk", timeit(proxy_walk, load)))
+    print("  %-32s %8.1f ms" % ("delete_shapes_in_pptx", timeit(lambda pptx_obj: pptx_obj.delete_shapes_in_pptx(),
+                                                                 load)))
+
+
+def build_image_template(image_count, source_path="./example.pptx"):
+    """
+    在 example.pptx 后面追加 image_count 页幻灯片，每页一张不同的噪点图片，模拟图片多的模板
+    :return: 模板的 bytes
+    """
+    from PIL import Image
+
+    pptx_obj = pptxtpl.PPTXTemplate(source_path)
+    presentation = pptx_obj.presentation
+    for i in range(image_count):
+        image = Image.effect_noise((800, 600), 32 + i).convert("RGB")
+        image_stream = io.BytesIO()
+        image.save(image_stream, "PNG")
+        image_stream.seek(0)
+        slide = presentation.slides.add_slide(presentation.slide_layouts[6])
+        slide.shapes.add_picture(image_stream, 0, 0)
+
+    return pptx_obj.save()
+
+
+def build_picture_slide_template(picture_count=20, source_path="./example.pptx"):
+    """
+    在 example.pptx 后面追加一页有 picture_count 张不同图片的幻灯片
+    :return: 模板的 bytes
+    """
+    from PIL import Image
+
+    pptx_obj = pptxtpl.PPTXTemplate(source_path)
+    presentation = pptx_obj.presentation
+    slide = presentation.slides.add_slide(presentation.slide_layouts[6])
+    for i in range(picture_count):
+        image = Image.effect_noise((200, 150), 32 + i).convert("RGB")
+        image_stream = io.BytesIO()
+        image.save(image_stream, "PNG")
+        image_stream.seek(0)
+        slide.shapes.add_picture(image_stream, Inches(i % 5 * 2), Inches(i // 5 * 1.5), Inches(2), Inches(1.5))
+
+    return pptx_obj.save()
+
+
+def benchmark_duplicate(copy_count=1000):
+    """
+    把一页图片多的幻灯片复制 copy_count 次：
+    每次复制都遍历 package 分配 partname(复制 N 页是 O(N^2))与共用一个 PartnameAllocator 的对比，
+    图片都共用原来的 image part
+    """
+    template_blob = build_picture_slide_template()
+
+    def load():
+        pptx_obj = pptxtpl.PPTXTemplate(io.BytesIO(template_blob))
+        return pptx_obj, len(pptx_obj.presentation.slides) - 1
+
+    def fresh_allocator(args):
+        pptx_obj, index = args
+        for _ in range(copy_count):
+            slide_copy.duplicate_slide(pptx_obj.presentation, index)
+
+    def shared_allocator(args):
+        pptx_obj, index = args
+        allocator = pptx_package.PartnameAllocator(pptx_obj.presentation.part.package)
+        for _ in range(copy_count):
+            slide_copy.duplicate_slide(pptx_obj.presentation, index, allocator)
+
+    def clone(args):
+        pptx_obj, index = args
+        for _ in range(copy_count):
+            pptx_obj.clone_slide(index, index)
+
+    print("duplicate: %d copies of a 20 picture slide" % copy_count)
+    print("  %-32s %8.1f ms" % ("copy shapes, allocator per copy", timeit(fresh_allocator, load, repeat=1)))
+    print("  %-32s %8.1f ms" % ("copy shapes, shared allocator", timeit(shared_allocator, load, repeat=1)))
+    print("  %-32s %8.1f ms" % ("clone_slide (part level)", timeit(clone, load, repeat=1)))
+
+
+def benchmark_merge(deck_count=50):
+    """
+    合并 deck_count 个从同一个模板渲染出的演示文稿(每个都带同样的图片)：
+    图片、版式、母版只保存一份，合并结果的大小只随各演示文稿不同的内容增长
+    """
+    template_blob = build_picture_slide_template(picture_count=5)
+    compiled_template = pptxtpl.CompiledTemplate(io.BytesIO(template_blob))
+    decks = []
+    for i in range(deck_count):
+        pptx_obj = compiled_template.new_template()
+        pptx_obj.replace_data(0, {"{name0}": "branch %d" % i})
+        decks.append(pptx_obj.save())
+
+    start = time.perf_counter()
+    merged = pptxtpl.merge_presentations(decks)
+    cost = (time.perf_counter() - start) * 1000
+
+    print("merge: %d decks" % deck_count)
+    print("  %-32s %8.1f ms" % ("merge_presentations", cost))
+    print("  %-32s %8.1f KB" % ("one deck", len(decks[0]) / 1024))
+    print("  %-32s %8.1f KB" % ("all decks", sum(len(deck) for deck in decks) / 1024))
+    print("  %-32s %8.1f KB" % ("merged deck", len(merged) / 1024))
+
+
+def build_photo_template(source_path="./example.pptx"):
+    """
+    在 example.pptx 的第0页加一个文本为 {photo} 的矩形(1.5 x 2 英寸)，作为图片标签
+    :return: 模板的 bytes
+    """
+    from pptx.enum.shapes import MSO_SHAPE
+
+    pptx_obj = pptxtpl.PPTXTemplate(source_path)
+    shape = pptx_obj.presentation.slides[0].shapes.add_shape(MSO_SHAPE.RECTANGLE, Inches(0.5), Inches(0.5),
+                                                             Inches(1.5), Inches(2))
+    shape.text = "{photo}"
+    return pptx_obj.save()
+
+
+def benchmark_images(record_count=50):
+    """
+    每条记录把同一张 4000x3000 的照片放进图片标签：
+    共享的 image_cache 缓存只在第一次解码、缩小；每次新建缓存相当于没有缓存；不缩小时输出文件带着原图
+    """
+    from PIL import Image
+
+    image = Image.effect_noise((4000, 3000), 64).convert("RGB")
+    image_stream = io.BytesIO()
+    image.save(image_stream, "JPEG", quality=90)
+    photo = image_stream.getvalue()
+    compiled_template = pptxtpl.CompiledTemplate(io.BytesIO(build_photo_template()))
+
+    def render(new_cache, dpi=image_cache.DEFAULT_DPI):
+        cache = image_cache.ImageCache()
+        start = time.perf_counter()
+        for _ in range(record_count):
+            if new_cache:
+                cache = image_cache.ImageCache()
+            pptx_obj = compiled_template.new_template()
+            pptx_obj.replace_images(0, {"{photo}": photo}, dpi=dpi, cache=cache)
+            out = pptx_obj.save()
+        return (time.perf_counter() - start) * 1000 / record_count, len(out)
+
+    print("images: %d records, %.1f KB photo" % (record_count, len(photo) / 1024.0))
+    for name, new_cache, dpi in [("shared cache", False, image_cache.DEFAULT_DPI),
+                                 ("new cache per record", True, image_cache.DEFAULT_DPI),
+                                 ("shared cache, no downscale", False, None)]:
+        cost, size = render(new_cache, dpi)
+        print("  %-32s %8.1f ms/record %8.1f KB" % (name, cost, size / 1024.0))
+
+
+def build_block_template(source_path="./example.pptx"):
+    """
+    在 example.pptx 的第0页加一个段落循环的文本框，和一个行循环的表格
+    :return: 模板的 bytes
+    """
+    pptx_obj = pptxtpl.PPTXTemplate(source_path)
+    shapes = pptx_obj.presentation.slides[0].shapes
+    text_frame = shapes.add_textbox(Inches(0.5), Inches(0.5), Inches(4), Inches(2)).text_frame
+    text_frame.text = "{% for student in students %}"
+    for text in ["{student.name}：{student.age}岁，第{loop.index}名", "{% endfor %}"]:
+        text_frame.add_paragraph().text = text
+    table = shapes.add_table(4, 2, Inches(5), Inches(0.5), Inches(4), Inches(1.6)).table
+    rows = [["姓名", "年龄"], ["{% for student in students %}", ""], ["{student.name}", "{student.age}"],
+            ["{% endfor %}", ""]]
+    for row_index, row in enumerate(rows):
+        for column_index, text in enumerate(row):
+            table.cell(row_index, column_index).text = text
+    return pptx_obj.save()
+
+
+def benchmark_blocks(student_count=200):
+    """
+    {% for %} 块：渲染实例直接执行模板编译好的计划，与每次渲染都重新编译计划对比
+    """
+    compiled_template = pptxtpl.CompiledTemplate(io.BytesIO(build_block_template()))
+    context = {"students": [{"name": "student%d" % i, "age": i % 100} for i in range(student_count)]}
+
+    def render(pptx_obj):
+        pptx_obj.render_blocks(0, context)
+
+    def cached_plan():
+        return compiled_template.new_template()
+
+    def new_plan():
+        pptx_obj = compiled_template.new_template()
+        pptx_obj.render_plans.clear()
+        return pptx_obj
+
+    print("blocks: %d students, paragraph loop + table row loop" % student_count)
+    print("  %-32s %8.1f ms" % ("compile plan every render", timeit(render, new_plan)))
+    print("  %-32s %8.1f ms" % ("compiled plan", timeit(render, cached_plan)))
+
+
+def benchmark_save(image_count=40, slide_count=300):
+    """
+    渲染第0页后保存：完整保存与增量保存(没有改变的图片、没有渲染的幻灯片直接复制压缩数据)的对比
+    """
+    data = get_replace_data()
+
+    def render(template_blob, incremental_save):
+        compiled_template = pptxtpl.CompiledTemplate(io.BytesIO(template_blob), incremental_save=incremental_save)
+
+        def setup():
+            pptx_obj = compiled_template.new_template()
+            pptx_obj.replace_data(0, data)
+            return pptx_obj
+        return setup
+
+    def save(pptx_obj):
+        pptx_obj.save(io.BytesIO())
+
+    templates = [
+        ("%d images" % image_count, build_image_template(image_count)),
+        ("%d slides" % slide_count, build_large_template(slide_count)),
+    ]
+    for name, template_blob in templates:
+        print("save: %s, %.1f MB template" % (name, len(template_blob) / 1024.0 / 1024))
+        print("  %-32s %8.1f ms" % ("full save", timeit(save, render(template_blob, False))))
+        print("  %-32s %8.1f ms" % ("incremental save", timeit(save, render(template_blob, True))))
+
+
+def benchmark_compression(slide_count=300):
+    """
+    保存到内存：不压缩与各个压缩级别的耗时、文件大小对比，分别用 example.pptx 和复制出的大模板
+    """
+    with open("./example.pptx", "rb") as f:
+        templates = [("example.pptx", f.read()), ("%d slides" % slide_count, build_large_template(slide_count))]
+    options = [("stored", zipfile.ZIP_STORED, None)]
+    options += [("deflate level %d" % level, zipfile.ZIP_DEFLATED, level) for level in (1, 6, 9)]
+
+    for template_name, template_blob in templates:
+        pptx_obj = pptxtpl.PPTXTemplate(io.BytesIO(template_blob))
+        print("compression: %s" % template_name)
+        for name, compression, compresslevel in options:
+            cost = timeit(lambda: pptx_obj.save(compression=compression, compresslevel=compresslevel))
+            size = len(pptx_obj.save(compression=compression, compresslevel=compresslevel))
+            print("  %-32s %8.1f ms %8.1f KB" % (name, cost, size / 1024.0))
+
+
+# 渲染核心路径不应该加载的重量级依赖，只在 DataFrame/ndarray、图表复制等路径中按需导入
+HEAVY_MODULES = ("numpy", "pandas", "openpyxl", "xlsxwriter")
+# 导入 pptxtpl 的耗时上限：python-pptx 本身约 200 ms，再导入 pandas 会超过 600 ms
+IMPORT_BUDGET_MS = 400
+
+IMPORT_SCRIPT = """
+import sys, time
+start = time.perf_counter()
+import %s
+print((time.perf_counter() - start) * 1000)
+print(",".join(name for name in %r if name in sys.modules))
+"""
+
+
+def benchmark_import(module_names=("pptxtpl", "render_batch"), budget_ms=IMPORT_BUDGET_MS, repeat=5):
+    """
+    在新的解释器中测量导入耗时，模拟短生命周期工作进程的冷启动
+    导入后加载了 HEAVY_MODULES 中的模块，或者耗时超过 budget_ms 时报错；budget_ms 为 None 时不检查耗时
+    """
+    print("import: fresh interpreter, best of %d" % repeat)
+    for module_name in module_names:
+        best = None
+        for _ in range(repeat):
+            output = subprocess.check_output([sys.executable, "-c", IMPORT_SCRIPT % (module_name, HEAVY_MODULES)],
+                                             universal_newlines=True)
+            cost, loaded = output.splitlines()
+            best = float(cost) if best is None else min(best, float(cost))
+
+        print("  %-32s %8.1f ms" % ("import %s" % module_name, best))
+        assert not loaded, "import %s loads heavy modules: %s" % (module_name, loaded)
+        assert budget_ms is None or best <= budget_ms, \
+            "import %s takes %.1f ms, budget is %.1f ms" % (module_name, best, budget_ms)
+
+
+if __name__ == "__main__":
+    benchmark_replace_data()
+    benchmark_substitute()
+    benchmark_chart()
+    benchmark_table_texts()
+    benchmark_table_rows()
+    benchmark_reorder()
+    benchmark_duplicate()
+    benchmark_single_shapes()
+    benchmark_prune()
+    benchmark_save()
+    benchmark_merge()
+    benchmark_images()
+    benchmark_blocks()
+    benchmark_compression()
+    benchmark_import()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+"""
+直接改写统计图 xml 中的数据缓存(c:tx、c:cat、c:val 下的 strCache/numCache)
+
+python-pptx 的 chart.replace_data 每次都会用 xlsxwriter 重新生成内嵌的 xlsx，这是渲染统计图最慢的部分；
+PowerPoint/WPS 显示统计图时只使用 xml 中的缓存，内嵌的 xlsx 只在编辑数据时使用
+"""
+import copy
+
+from lxml import etree
+from pptx.oxml.ns import qn
+
+import frame_data
+
+
+SHEET_NAME = "Sheet1"
+
+
+def get_column_letter(column):
+    """
+    excel 的列号转成字母，1 -> A，27 -> AA
+    """
+    letters = []
+    while column > 0:
+        column, remainder = divmod(column - 1, 26)
+        letters.append(chr(ord("A") + remainder))
+    return "".join(reversed(letters))
+
+
+def is_missing(value):
+    # NaN 不等于自身
+    return value is None or value != value
+
+
+def _append_pts(cache, values):
+    etree.SubElement(cache, qn("c:ptCount"), val=str(len(values)))
+    if frame_data.is_array(values):
+        # ndarray、Series 按列向量化转成文本
+        points = zip(*frame_data.get_point_texts(values))
+    else:
+        points = ((idx, str(value)) for idx, value in enumerate(values) if not is_missing(value))
+    for idx, text in points:
+        pt = etree.SubElement(cache, qn("c:pt"), idx=str(idx))
+        etree.SubElement(pt, qn("c:v")).text = text
+
+
+def _set_str_ref(parent, ref, values):
+    parent.clear()
+    str_ref = etree.SubElement(parent, qn("c:strRef"))
+    etree.SubElement(str_ref, qn("c:f")).text = ref
+    _append_pts(etree.SubElement(str_ref, qn("c:strCache")), values)
+
+
+def _set_num_ref(parent, ref, values, number_format):
+    parent.clear()
+    num_ref = etree.SubElement(parent, qn("c:numRef"))
+    etree.SubElement(num_ref, qn("c:f")).text = ref
+    num_cache = etree.SubElement(num_ref, qn("c:numCache"))
+    etree.SubElement(num_cache, qn("c:formatCode")).text = number_format
+    _append_pts(num_cache, values)
+
+
+def adjust_series_count(plot_area, count):
+    """
+    调整 c:ser 的个数，与 python-pptx 的做法相同：
+    多出的从后往前删除(删空的 xChart 一起删除)，不够的复制最后一个 c:ser，保留其格式
+    """
+    sers = plot_area.sers
+    if count > len(sers):
+        last_ser = plot_area.last_ser
+        for _ in range(count - len(sers)):
+            new_ser = copy.deepcopy(last_ser)
+            new_ser.idx.val = plot_area.next_idx
+            new_ser.order.val = plot_area.next_order
+            last_ser.addnext(new_ser)
+            last_ser = new_ser
+    elif count < len(sers):
+        for ser in sers[count:]:
+            ser.getparent().remove(ser)
+        for x_chart in [x_chart for x_chart in plot_area.iter_xCharts() if len(x_chart.sers) == 0]:
+            x_chart.getparent().remove(x_chart)
+
+
+def replace_category_chart_data(chart_space, categories, series):
+    """
+    用新的数据改写分类统计图(柱状图、折线图、饼图等)的数据缓存，系列的格式保持不变
+    单元格引用与 python-pptx 生成的 xlsx 布局一致：A列是分类，B列开始每列一个系列，第1行是系列名称
+    :param chart_space: 统计图的 c:chartSpace 元素，即 chart._chartSpace
+    :param categories: 分类列表
+    :param series: [(系列名称, 数值列表)]，数值为 None 或 NaN 时留空
+                   数值列可以是 ndarray 或 pandas Series，此时 inf 也留空
+    :return:
+    """
+    plot_area = chart_space.plotArea
+    adjust_series_count(plot_area, len(series))
+
+    last_row = len(categories) + 1
+    category_ref = "%s!$A$2:$A$%d" % (SHEET_NAME, last_row)
+    for column, (ser, (name, values)) in enumerate(zip(plot_area.sers, series), 2):
+        letter = get_column_letter(column)
+
+        number_formats = ser.xpath("./c:val/c:numRef/c:numCache/c:formatCode/text()")
+        number_format = number_formats[0] if number_formats else "General"
+
+        _set_str_ref(ser.get_or_add_tx(), "%s!$%s$1" % (SHEET_NAME, letter), [name])
+        _set_str_ref(ser.get_or_add_cat(), category_ref, list(categories))
+        if not frame_data.is_array(values):
+            values = list(values)
+        _set_num_ref(ser.get_or_add_val(), "%s!$%s$2:$%s$%d" % (SHEET_NAME, letter, letter, last_row),
+                     values, number_format)
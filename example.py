@@ -76,8 +76,20 @@ pptx_obj.replace_bar_chart_data(index=1, title_data=title_data, title_replace=ti
 pptx_obj.pptx_copy_slide(0, 1)
 
 
-# 办法二：复制方法中无法复制带有chart的统计图，比如柱状图，一般可在模板中手动复制若干个幻灯片
-#        然后将没有填充的幻灯片利用删除方法删除多余幻灯片即可
+# 带有chart的统计图(比如柱状图)、备注页的幻灯片也可以复制，统计图及其数据随幻灯片一起复制
+# 办法二：fan_out_slide 以一页幻灯片为模板，每条数据渲染出一页
+# 柱状图幻灯片复制后在第2页，每个班级渲染出一页柱状图
+class_records = [{"category": ["不及格", "及格"], "data": {"三班": [10, 90]}},
+                 {"category": ["不及格", "及格"], "data": {"四班": [25, 75]}}]
+
+
+def render_class_chart(pptx_obj, slide_index, record):
+    for shape in pptx_obj.presentation.slides[slide_index].shapes:
+        if shape.has_chart:
+            pptx_obj.replace_bar_chart_data_by_chart(shape.chart, record)
+
+
+pptx_obj.fan_out_slide(2, class_records, render_func=render_class_chart)
 
 
 
@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+"""
+pandas DataFrame / numpy ndarray 数据转成统计图、表格需要的格式
+
+格式化按列进行：缺失值(NaN、inf)的判断用 numpy 向量化完成，每列只做一次 tolist()，
+再用 map 在 C 中逐个格式化，不为每个单元格执行 python 代码
+(numpy 的 astype(str)、np.char.mod 格式化浮点数反而比 map 慢)
+numpy 只在处理 ndarray/DataFrame 时才导入，普通 list 数据的渲染不加载 numpy；
+pandas 不需要在这里导入：DataFrame、Series 通过属性判断，用 numpy 读取
+"""
+import sys
+
+
+def is_data_frame(data):
+    return hasattr(data, "columns") and hasattr(data, "index")
+
+
+def is_array(data):
+    """
+    ndarray、pandas Series 等可以直接转成 ndarray 的数据
+    """
+    # numpy 还没有导入时不可能有 ndarray，不为了判断类型而导入 numpy
+    np = sys.modules.get("numpy")
+    if np is None:
+        return False
+    return isinstance(data, np.ndarray) or (hasattr(data, "to_numpy") and not is_data_frame(data))
+
+
+def get_finite_mask(array):
+    """
+    有效数值的掩码，None、NaN、inf 为 False
+    """
+    import numpy as np
+
+    if array.dtype.kind in "iub":
+        return np.ones(array.shape, dtype=bool)
+    if array.dtype.kind != "f":
+        array = array.astype(float)
+    return np.isfinite(array)
+
+
+def get_point_texts(values):
+    """
+    一列数值转成统计图数据缓存中的点：(序号列表, 文本列表)，None、NaN、inf 留空
+    :param values: ndarray 或 pandas Series
+    :return:
+    """
+    import numpy as np
+
+    array = np.asarray(values)
+    mask = get_finite_mask(array)
+    if mask.all():
+        return range(len(array)), list(map(str, array.tolist()))
+    return np.flatnonzero(mask).tolist(), list(map(str, array[mask].tolist()))
+
+
+def get_value_list(values):
+    """
+    一列数值转成 CategoryChartData 使用的列表，NaN、inf 转成 None
+    """
+    import numpy as np
+
+    array = np.asarray(values)
+    mask = get_finite_mask(array)
+    if mask.all():
+        return array.tolist()
+    result = array.astype(object)
+    result[~mask] = None
+    return result.tolist()
+
+
+def get_chart_columns(data):
+    """
+    统计图数据统一成 (分类列表, [(系列名称, 数值列)])
+    :param data: 以下任意一种
+                 {"category": ["不及格", "及格"], "data": {"一班": [3, 80], "二班": [2, 80]}}，数值列可以是 list、ndarray、Series
+                 DataFrame：index 是分类，每一列是一个系列，与 slide_copy.dataframe_to_chart_data 相同
+    :return:
+    """
+    if is_data_frame(data):
+        categories = data.index.astype(str).tolist()
+        series = [(str(column), data[column].to_numpy()) for column in data.columns]
+        return categories, series
+
+    categories = data.get("category", [])
+    if is_array(categories):
+        import numpy as np
+
+        categories = np.asarray(categories).astype(str).tolist()
+    return categories, list(data.get("data", {}).items())
+
+
+def format_column(values, number_format=None, na_rep=""):
+    """
+    一列数据格式化成文本
+    :param values: ndarray 或 pandas Series
+    :param number_format: 数字格式，% 格式化的写法，比如 "%.2f"，只用于数值列
+    :param na_rep: 缺失值(None、NaN、inf、NA、NaT)显示的文本
+    :return: 文本列表
+    """
+    import numpy as np
+
+    dtype = getattr(values, "dtype", None)
+    if is_array(values) and not isinstance(values, np.ndarray) and \
+            (not isinstance(dtype, np.dtype) or dtype.kind in "Mm"):
+        # pandas 的可空类型(Int64 等)、时间列：转成 ndarray 时整数会变成浮点数、时间会变成整数，
+        # 所以转成 python 对象；缺失值(NA、NaT)用 notna() 判断
+        array = values.to_numpy(dtype=object, na_value=None)
+        mask = values.notna().to_numpy()
+        formatter = number_format.__mod__ if number_format and dtype.kind in "iuf" else str
+        return _format_masked(array, mask, formatter, na_rep)
+
+    array = np.asarray(values)
+    if array.dtype.kind in "iuf":
+        mask = get_finite_mask(array)
+        formatter = number_format.__mod__ if number_format else str
+    elif array.dtype.kind == "O":
+        # NaN 不等于自身
+        mask = (array == array) & (array != None)
+        formatter = str
+    elif array.dtype.kind in "Mm":
+        mask = ~np.isnat(array)
+        formatter = str
+    else:
+        mask = None
+        formatter = str
+    return _format_masked(array, mask, formatter, na_rep)
+
+
+def _format_masked(array, mask, formatter, na_rep):
+    """
+    格式化 mask 为 True 的值，其它显示 na_rep；mask 为 None 表示全部有效
+    """
+    import numpy as np
+
+    if mask is None or mask.all():
+        return list(map(formatter, array.tolist()))
+
+    texts = [na_rep] * len(array)
+    valid_texts = map(formatter, array[mask].tolist())
+    for i, text in zip(np.flatnonzero(mask).tolist(), valid_texts):
+        texts[i] = text
+    return texts
+
+
+def get_table_texts(data, number_format=None, na_rep=""):
+    """
+    表格数据转成文本的二维列表，按列格式化
+    :param data: DataFrame(不含表头和索引)、二维 ndarray；其它数据原样返回，由调用方逐个 str()
+    :param number_format: 数字格式，可以是 "%.2f" 这样的字符串，也可以是 {列名或列序号: 格式}
+    :param na_rep: 缺失值显示的文本
+    :return:
+    """
+    if is_data_frame(data):
+        names = list(data.columns)
+        # 按位置取列(列名可能重复)，保留 Series 让 format_column 处理可空类型和时间列
+        columns = [data.iloc[:, i] for i in range(len(names))]
+    elif is_array(data):
+        import numpy as np
+
+        array = np.asarray(data)
+        if array.ndim == 1:
+            array = array.reshape(-1, 1)
+        names = list(range(array.shape[1]))
+        columns = [array[:, i] for i in names]
+    else:
+        return data
+
+    if not columns:
+        return []
+
+    texts = []
+    for i, (name, column) in enumerate(zip(names, columns)):
+        column_format = number_format
+        if isinstance(number_format, dict):
+            column_format = number_format.get(name, number_format.get(i))
+        texts.append(format_column(column, column_format, na_rep))
+
+    return list(map(list, zip(*texts)))
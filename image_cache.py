@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+"""
+图片标签(PPTXTemplate.replace_images)使用的图片缓存
+
+按内容寻址：以图片内容的 sha1 + 目标像素大小为键，缓存缩小后的图片
+同一张图片(比如公司标志、二维码)在成千上万次渲染中只读取、解码、缩小一次；
+渲染结果中按缩小后图片的 sha1 去重，一份演示文稿中相同的图片只保存一份
+Pillow 只在需要缩小图片时导入
+"""
+import io
+import os
+import math
+import hashlib
+import threading
+import collections
+
+from pptx.parts.image import Image
+
+
+# 默认按 150 dpi 计算图形需要的像素，超出的图片缩小
+DEFAULT_DPI = 150
+EMU_PER_INCH = 914400
+
+# 缩小后按原格式保存的格式，其它格式(gif 动画、wmf 矢量图等)不缩小
+DOWNSCALE_FORMATS = {"JPEG", "PNG"}
+JPEG_QUALITY = 90
+
+# sha1: 图片内容的 sha1；size: (宽, 高) 像素
+PreparedImage = collections.namedtuple("PreparedImage", ["sha1", "blob", "content_type", "ext", "size"])
+
+
+def get_target_pixels(cx, cy, dpi=DEFAULT_DPI):
+    """
+    图形的大小(EMU)按 dpi 换算成像素
+    :return: (宽, 高)
+    """
+    return (max(int(math.ceil(cx * dpi / EMU_PER_INCH)), 1),
+            max(int(math.ceil(cy * dpi / EMU_PER_INCH)), 1))
+
+
+def read_image_blob(image):
+    """
+    :param image: 图片路径、bytes 或者文件对象
+    :return: bytes
+    """
+    if isinstance(image, bytes):
+        return image
+    if isinstance(image, str):
+        with open(image, "rb") as f:
+            return f.read()
+    if callable(getattr(image, "seek", None)):
+        image.seek(0)
+    return image.read()
+
+
+def downscale(blob, size, image_format, target_size):
+    """
+    图片大于填满 target_size 所需的大小时，等比例缩小
+    :param blob: 图片内容
+    :param size: 图片的 (宽, 高) 像素
+    :param image_format: Pillow 的格式名称，比如 JPEG
+    :param target_size: 图形需要的 (宽, 高) 像素
+    :return: (blob, size)，不需要缩小时原样返回
+    """
+    if image_format not in DOWNSCALE_FORMATS:
+        return blob, size
+    # 填满图形(居中裁剪)时，图片的宽、高都不能小于图形
+    scale = max(float(target_size[0]) / size[0], float(target_size[1]) / size[1])
+    if scale >= 1:
+        return blob, size
+
+    from PIL import Image as PILImage
+
+    new_size = (max(int(math.ceil(size[0] * scale)), 1), max(int(math.ceil(size[1] * scale)), 1))
+    pil_image = PILImage.open(io.BytesIO(blob))
+    if image_format == "JPEG":
+        # JPEG 解码时直接按 1/2、1/4、1/8 缩小，不必解码完整的大图
+        pil_image.draft(pil_image.mode, new_size)
+    pil_image = pil_image.resize(new_size, PILImage.LANCZOS)
+    stream = io.BytesIO()
+    if image_format == "JPEG":
+        pil_image.save(stream, "JPEG", quality=JPEG_QUALITY)
+    else:
+        pil_image.save(stream, "PNG")
+
+    new_blob = stream.getvalue()
+    if len(new_blob) >= len(blob):
+        return blob, size
+    return new_blob, new_size
+
+
+class ImageCache(object):
+    """
+    图片缓存，线程安全
+    缓存的图片总大小超过 max_nbytes 时，淘汰最久没有使用的图片
+    """
+
+    def __init__(self, max_nbytes=256 * 1024 * 1024):
+        self.max_nbytes = max_nbytes
+        self.nbytes = 0
+        # {(原图 sha1, 目标像素大小): PreparedImage}
+        self._images = collections.OrderedDict()
+        # 图片路径 -> 原图 sha1，路径对应的文件没有变化时不再读取文件
+        self._path_sha1s = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._images)
+
+    def get(self, image, target_size=None):
+        """
+        获取处理好的图片
+        :param image: 图片路径、bytes 或者文件对象
+        :param target_size: 图形需要的 (宽, 高) 像素，图片更大时缩小；None 表示不缩小
+        :return: PreparedImage
+        """
+        path_key = None
+        if isinstance(image, str):
+            stat = os.stat(image)
+            path_key = (os.path.abspath(image), stat.st_mtime, stat.st_size)
+            with self._lock:
+                source_sha1 = self._path_sha1s.get(path_key)
+                prepared = self._images.get((source_sha1, target_size))
+                if prepared is not None:
+                    self._images.move_to_end((source_sha1, target_size))
+                    return prepared
+
+        blob = read_image_blob(image)
+        source_sha1 = hashlib.sha1(blob).hexdigest()
+        key = (source_sha1, target_size)
+        with self._lock:
+            if path_key is not None:
+                self._path_sha1s[path_key] = source_sha1
+            prepared = self._images.get(key)
+            if prepared is not None:
+                self._images.move_to_end(key)
+                return prepared
+
+        prepared = self.prepare(blob, source_sha1, target_size)
+
+        with self._lock:
+            if key not in self._images:
+                self._images[key] = prepared
+                self.nbytes += len(prepared.blob)
+                self._evict()
+        return prepared
+
+    @staticmethod
+    def prepare(blob, source_sha1, target_size=None):
+        """
+        识别图片格式，需要时缩小
+        :return: PreparedImage
+        """
+        image = Image.from_blob(blob)
+        size = image.size
+        if target_size is not None:
+            new_blob, size = downscale(blob, size, image._format, target_size)
+            if new_blob is not blob:
+                blob = new_blob
+                source_sha1 = hashlib.sha1(blob).hexdigest()
+        return PreparedImage(source_sha1, blob, image.content_type, image.ext, size)
+
+    def clear(self):
+        with self._lock:
+            self._images.clear()
+            self._path_sha1s.clear()
+            self.nbytes = 0
+
+    def _evict(self):
+        # 至少保留刚刚加入的图片
+        while len(self._images) > 1 and self.nbytes > self.max_nbytes:
+            _, prepared = self._images.popitem(last=False)
+            self.nbytes -= len(prepared.blob)
+
+
+# 进程内共享的默认缓存
+DEFAULT_IMAGE_CACHE = ImageCache()
@@ -0,0 +1,319 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+"""
+模板清单：扫描一次模板，列出所有替换标签及其位置、{% for %}/{% if %} 块中的标签、统计图标题标签、表格、章节标记(slide_id)
+清单是可以缓存的 JSON，渲染前用它校验数据，缺少标签等错误在分发给渲染进程之前就能发现
+
+命令行：
+python inventory.py template.pptx -o template.json
+python inventory.py template.pptx --validate records.jsonl
+"""
+import io
+import sys
+import json
+import hashlib
+import argparse
+
+from pptx.oxml.ns import qn
+
+import pptxtpl
+import xml_engine
+import frame_data
+import render_plan
+
+
+INVENTORY_VERSION = 1
+
+def get_shape_name(shape_element):
+    """
+    图形的名称：p:nvSpPr、p:nvGraphicFramePr 等第一个子元素下的 p:cNvPr
+    """
+    c_nv_pr = shape_element[0].find(qn("p:cNvPr")) if len(shape_element) else None
+    return c_nv_pr.get("name") if c_nv_pr is not None else None
+
+
+def get_split_labels(pptx_obj, sp_tree):
+    """
+    被拆分到多个run中的标签，必须在 build_slide_label_index 合并之前调用
+    :return: set((tx_body, 段落序号, 标签))
+    """
+    left_flag = pptx_obj.get_replace_label_left_part()
+    split_labels = set()
+    for tx_body in xml_engine.get_text_bodies(sp_tree):
+        for paragraph_index, p in enumerate(tx_body.findall(xml_engine.TAG_P)):
+            paragraph_text = xml_engine.get_paragraph_text(p)
+            if left_flag not in paragraph_text:
+                continue
+            run_labels = set()
+            for r in p.findall(xml_engine.TAG_R):
+                run_labels.update(pptx_obj.get_replace_label_ids(xml_engine.get_run_text(r)) or [])
+            for label in set(pptx_obj.get_replace_label_ids(paragraph_text) or []) - run_labels:
+                split_labels.add((tx_body, paragraph_index, label))
+    return split_labels
+
+
+def get_slide_labels(pptx_obj, slide):
+    """
+    一页幻灯片上 replace_data 能替换的标签及其位置
+    """
+    sp_tree = slide.shapes._spTree
+    split_labels = get_split_labels(pptx_obj, sp_tree)
+    slide_label_index = pptx_obj.build_slide_label_index(slide)
+
+    labels = []
+    for label, locations in slide_label_index.items():
+        for location in locations:
+            shape_element = sp_tree
+            for i in location.shape_path:
+                shape_element = shape_element[i]
+            tx_body = shape_element.find(xml_engine.TAG_TX_BODY)
+            labels.append({
+                "label": label,
+                "shape_name": get_shape_name(shape_element),
+                "shape_path": list(location.shape_path),
+                "paragraph": location.paragraph_index,
+                "run": location.run_index,
+                "split": (tx_body, location.paragraph_index, label) in split_labels,
+            })
+
+    labels.sort(key=lambda item: (item["shape_path"], item["paragraph"], item["run"], item["label"]))
+    return labels
+
+
+def get_slide_charts(slide):
+    """
+    一页幻灯片上的统计图，title 是 replace_bar_chart_data 中 title_data 的键
+    """
+    charts = []
+    for shape in slide.shapes:
+        if not shape.has_chart:
+            continue
+        chart_space = shape.chart_part._element
+        sers = chart_space.plotArea.sers
+        charts.append({
+            "title": xml_engine.get_chart_title(chart_space),
+            "shape_name": shape.name,
+            "chart_type": str(shape.chart.chart_type),
+            "series": len(sers),
+            "categories": sers[0].cat_ptCount_val if sers else 0,
+        })
+    return charts
+
+
+def get_slide_tables(slide):
+    """
+    一页幻灯片上的表格，add_table_data 只填充最后一个表格，第0行是表头
+    """
+    tables = []
+    for shape in slide.shapes:
+        if not shape.has_table:
+            continue
+        tbl = shape.table._tbl
+        tables.append({
+            "shape_name": shape.name,
+            "rows": len(tbl.tr_lst),
+            "columns": len(tbl.tblGrid.gridCol_lst),
+            "data_rows": max(len(tbl.tr_lst) - 1, 0),
+            "add_table_data": False,
+        })
+    if tables:
+        tables[-1]["add_table_data"] = True
+    return tables
+
+
+def build_inventory(pptx_template, label_format="{%s}"):
+    """
+    扫描模板，生成清单
+    :param pptx_template: 模板路径或者模板的 bytes
+    :param label_format: 替换标签的格式
+    :return: 可以直接 json.dump 的 dict
+    """
+    if isinstance(pptx_template, bytes):
+        template_blob = pptx_template
+    else:
+        with open(pptx_template, "rb") as f:
+            template_blob = f.read()
+
+    pptx_obj = pptxtpl.PPTXTemplate(io.BytesIO(template_blob), label_format=label_format)
+    slide_ids = dict((slide_part, slide_id)
+                     for slide_id, slide_parts in pptx_obj.build_slide_id_index().items()
+                     for slide_part in slide_parts)
+
+    slides = []
+    for index, slide in enumerate(pptx_obj.presentation.slides):
+        slides.append({
+            "index": index,
+            "partname": str(slide.part.partname),
+            "slide_id": slide_ids.get(slide.part),
+            "labels": get_slide_labels(pptx_obj, slide),
+            "block_labels": sorted(render_plan.get_plan_labels(pptx_obj.get_render_plan(slide))),
+            "charts": get_slide_charts(slide),
+            "tables": get_slide_tables(slide),
+        })
+
+    labels = {}
+    chart_titles = {}
+    for slide in slides:
+        for item in slide["labels"]:
+            indexes = labels.setdefault(item["label"], [])
+            if slide["index"] not in indexes:
+                indexes.append(slide["index"])
+        for chart in slide["charts"]:
+            chart_titles.setdefault(chart["title"], []).append(slide["index"])
+
+    return {
+        "version": INVENTORY_VERSION,
+        "sha1": hashlib.sha1(template_blob).hexdigest(),
+        "label_format": pptx_obj.label_format.label_format,
+        "slide_count": len(slides),
+        "labels": labels,
+        "chart_titles": chart_titles,
+        "slide_ids": pptx_obj.get_slide_id_index(),
+        "slides": slides,
+    }
+
+
+def is_inventory_of(inventory, pptx_template):
+    """
+    缓存的清单是否由这个模板生成(模板修改后清单需要重新生成)
+    :param pptx_template: 模板路径或者模板的 bytes
+    """
+    if not isinstance(pptx_template, bytes):
+        with open(pptx_template, "rb") as f:
+            pptx_template = f.read()
+    return inventory.get("version") == INVENTORY_VERSION and inventory.get("sha1") == hashlib.sha1(pptx_template).hexdigest()
+
+
+def _get_table_columns(table_data):
+    """
+    table_data 的列数，格式不对时返回 None
+    :param table_data: 二维列表、DataFrame 或二维 ndarray，见 PPTXTemplate.add_table_data
+    """
+    if frame_data.is_data_frame(table_data):
+        return len(table_data.columns)
+    if frame_data.is_array(table_data):
+        shape = getattr(table_data, "shape", ())
+        return shape[1] if len(shape) == 2 else 1 if len(shape) == 1 else None
+    if not isinstance(table_data, (list, tuple)) or not all(isinstance(row, (list, tuple)) for row in table_data):
+        return None
+    return max([len(row) for row in table_data] or [0])
+
+
+def validate_record(inventory, record, strict=False):
+    """
+    渲染前校验一条记录(格式见 render_batch.render_record)
+    - 记录、幻灯片条目以及其中各项数据的类型不对(比如 replace_data 不是对象、table_data 的行不是列表)
+    - 幻灯片索引超出范围
+    - replace_data(以及 image_data，有 context 时块中的标签除外)缺少该页幻灯片上的标签；
+      delete_shapes 为 true 时没有数据的标签所在的图形会被删除，不算错误
+    - title_data 中的标题在该页幻灯片上找不到统计图
+    - table_data 的列数超出表格的列数，或者该页没有表格
+    格式不对的记录同样返回错误信息，不抛出异常
+    :param inventory: build_inventory 的结果
+    :param record:
+    :param strict: 为 True 时，data 中多出的、模板上不存在的标签也算错误
+    :return: 错误信息列表，没有错误时为空列表
+    """
+    if not isinstance(record, dict):
+        return ["record must be an object, got %s" % type(record).__name__]
+    slides_data = record.get("slides", [])
+    if not isinstance(slides_data, (list, tuple)):
+        return ["slides must be a list, got %s" % type(slides_data).__name__]
+
+    errors = []
+    slides = inventory["slides"]
+    for position, slide_data in enumerate(slides_data):
+        if not isinstance(slide_data, dict):
+            errors.append("slides[%d] must be an object, got %s" % (position, type(slide_data).__name__))
+            continue
+        index = slide_data.get("index")
+        if not isinstance(index, int) or isinstance(index, bool) or not -len(slides) <= index < len(slides):
+            errors.append("slide index out of range: %r" % (index,))
+            continue
+        slide = slides[index]
+        index = slide["index"]
+
+        type_errors = ["slide %d: %s must be an object" % (index, key)
+                       for key in ("replace_data", "image_data", "context", "title_data", "title_replace")
+                       if key in slide_data and not isinstance(slide_data[key], dict)]
+        if type_errors:
+            errors.extend(type_errors)
+            continue
+
+        if "replace_data" in slide_data:
+            slide_labels = set(item["label"] for item in slide["labels"])
+            data_labels = set(slide_data["replace_data"])
+            # 文本是图片标签的图形由 replace_images 替换
+            image_labels = set(slide_data.get("image_data", ()))
+            # {% for %}、{% if %} 块中的标签由 render_blocks 用 context 替换
+            block_labels = set(slide.get("block_labels", ())) if "context" in slide_data else set()
+            if not slide_data.get("delete_shapes"):
+                for label in sorted(slide_labels - data_labels - image_labels - block_labels):
+                    errors.append("slide %d: missing label %s" % (index, label))
+            if strict:
+                for label in sorted(data_labels - slide_labels, key=str):
+                    errors.append("slide %d: unknown label %s" % (index, label))
+
+        if "title_data" in slide_data:
+            chart_titles = set(chart["title"] for chart in slide["charts"])
+            for title in sorted(set(slide_data["title_data"]) - chart_titles, key=str):
+                errors.append("slide %d: no chart titled %s" % (index, title))
+
+        if "table_data" in slide_data:
+            columns = _get_table_columns(slide_data["table_data"])
+            if columns is None:
+                errors.append("slide %d: table_data must be a list of rows" % index)
+                continue
+            tables = [table for table in slide["tables"] if table["add_table_data"]]
+            if not tables:
+                errors.append("slide %d: no table for table_data" % index)
+                continue
+            # 行数不够时 add_table_data 会复制行，只检查列数
+            table = tables[0]
+            if columns > table["columns"]:
+                errors.append("slide %d: table has %d columns, got %d" % (index, table["columns"], columns))
+
+    return errors
+
+
+def load_inventory(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_inventory(inventory, path):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(inventory, f, ensure_ascii=False, indent=2)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="扫描模板，输出标签、统计图、表格、章节标记的清单(JSON)")
+    parser.add_argument("template", help="pptx 模板")
+    parser.add_argument("-o", "--output", help="清单输出路径，默认输出到标准输出")
+    parser.add_argument("--label-format", default="{%s}", help="替换标签的格式")
+    parser.add_argument("--validate", help="用清单校验 jsonl 中的每条记录，格式见 render_batch.render_record")
+    parser.add_argument("--strict", action="store_true", help="校验时模板上不存在的标签也算错误")
+    args = parser.parse_args(argv)
+
+    inventory = build_inventory(args.template, args.label_format)
+
+    if args.validate:
+        import render_batch
+
+        failed = 0
+        for index, record in enumerate(render_batch.iter_jsonl(args.validate)):
+            for error in validate_record(inventory, record, args.strict):
+                failed += 1
+                sys.stderr.write("record %d (%s): %s\n" % (index, render_batch.get_record_name(index, record), error))
+        return 1 if failed else 0
+
+    if args.output:
+        save_inventory(inventory, args.output)
+    else:
+        json.dump(inventory, sys.stdout, ensure_ascii=False, indent=2)
+        sys.stdout.write("\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,1014 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+"""
+pptx 包(OPC package)层面的底层操作，供 pptxtpl 使用
+
+python-pptx 没有提供复制整个 Presentation 的接口，这里直接操作 part 以及
+part 之间的 relationship
+"""
+import re
+import io
+import copy
+import hashlib
+import struct
+import zipfile
+
+from lxml import etree
+from pptx.opc.constants import CONTENT_TYPE as CT, RELATIONSHIP_TARGET_MODE as RTM, RELATIONSHIP_TYPE as RT
+from pptx.opc.oxml import serialize_part_xml
+from pptx.opc.package import Part, XmlPart, _Relationship, _Relationships
+from pptx.opc.packuri import CONTENT_TYPES_URI, PACKAGE_URI, PackURI
+from pptx.opc.serialized import _ContentTypesItem
+from pptx.oxml.ns import namespaces, qn
+from pptx.util import lazyproperty
+
+
+RT_CHART_STYLE = "http://schemas.microsoft.com/office/2011/relationships/chartStyle"
+
+# 复制幻灯片时，这些关系指向的 part 属于被复制的 part 私有，需要一起复制一份；
+# 其它关系(版式、图片、超链接等)指向的 part 新旧 part 共用
+PRIVATE_RELTYPES = {
+    RT.CHART,
+    RT.PACKAGE,
+    RT.CHART_COLOR_STYLE,
+    RT_CHART_STYLE,
+    RT.CHART_USER_SHAPES,
+}
+
+# duplicate_part 不复制的关系：备注页与幻灯片一一对应，不能共用，由 duplicate_slide 单独复制
+SKIPPED_RELTYPES = {
+    RT.NOTES_SLIDE,
+}
+
+
+# 渲染过程中只读的 xml 部件：版式、母版、主题等，克隆时直接共享
+SHARED_XML_CONTENT_TYPES = {
+    CT.PML_SLIDE_LAYOUT,
+    CT.PML_SLIDE_MASTER,
+    CT.PML_NOTES_MASTER,
+    CT.PML_HANDOUT_MASTER,
+    CT.OFC_THEME,
+}
+
+
+def is_shareable_part(part):
+    """
+    判断 part 是否可以在多个渲染实例之间共享
+    图片、音视频等二进制部件不会被原地修改；内嵌的 xlsx 会被统计图替换数据时改写，不能共享
+    """
+    content_type = part.content_type
+    if content_type in SHARED_XML_CONTENT_TYPES:
+        return True
+    if isinstance(part, XmlPart):
+        return False
+    return content_type.startswith(("image/", "video/", "audio/"))
+
+
+def get_shared_parts(package):
+    """
+    找出可以共享的 part
+    一个 part 只有在它引用的所有 part 也都可共享时才能共享，否则保存时会写出两份同名 part
+    :param package:
+    :return: set(part)
+    """
+    shared = set(part for part in package.iter_parts() if is_shareable_part(part))
+
+    changed = True
+    while changed:
+        changed = False
+        for part in list(shared):
+            for rel in part.rels.values():
+                if not rel.is_external and rel.target_part not in shared:
+                    shared.discard(part)
+                    changed = True
+                    break
+
+    return shared
+
+
+def _clone_part_object(part, package):
+    """
+    浅复制 part 对象：去掉 lazyproperty 的缓存，xml 部件深复制 _element
+    二进制部件的 _blob 是不可变的 bytes，直接复用
+    """
+    part_cls = type(part)
+    new_part = part_cls.__new__(part_cls)
+    for key, value in part.__dict__.items():
+        if isinstance(getattr(part_cls, key, None), lazyproperty):
+            continue
+        new_part.__dict__[key] = value
+
+    new_part._package = package
+    if isinstance(part, XmlPart):
+        new_part._element = copy.deepcopy(part._element)
+
+    return new_part
+
+
+def _clone_rels(rels, base_uri, clone_target):
+    new_rels = _Relationships(base_uri)
+    for rId, rel in rels.items():
+        target = rel.target_ref if rel.is_external else clone_target(rel.target_part)
+        new_rels._rels[rId] = _Relationship(base_uri, rId, rel.reltype, rel._target_mode, target)
+    return new_rels
+
+
+def clone_package(package, shared_parts=None):
+    """
+    克隆整个 package，得到与原 package 互不影响的新 package
+    只复制渲染时可能被修改的 part(幻灯片、统计图、备注、presentation.xml 等)，
+    shared_parts 中的 part 新旧 package 共用同一个对象，记录在新 package 上(见 make_parts_private)
+    其它 part 每次都深复制，开销与 package 中幻灯片、统计图等 part 的多少成正比
+    package 有快照时，没有修改过的 part(见 get_clean_parts)克隆出的 part 同样记为没有修改过，
+    快照之后修改过 package 的，先调用 PackageSnapshot.refresh
+    :param package: pptx.package.Package
+    :param shared_parts: get_shared_parts 的结果，为 None 时现场计算
+    :return: 新的 package
+    """
+    if shared_parts is None:
+        shared_parts = get_shared_parts(package)
+
+    package_cls = type(package)
+    new_package = package_cls.__new__(package_cls)
+    new_package._pkg_file = package._pkg_file
+
+    cloned = {}
+
+    def clone_target(part):
+        if part in shared_parts:
+            return part
+        if part in cloned:
+            return cloned[part]
+
+        new_part = _clone_part_object(part, new_package)
+        # 先登记再处理 rels，relationship 存在环(比如 notesSlide -> slide)
+        cloned[part] = new_part
+        new_part.__dict__["_rels"] = _clone_rels(part.rels, part.partname.baseURI, clone_target)
+        return new_part
+
+    new_package.__dict__["_rels"] = _clone_rels(package._rels, package._rels._base_uri, clone_target)
+    new_package.__dict__["_shared_parts"] = shared_parts
+    # 克隆出的 part 与原 part 内容相同，原 part 没有修改过(见 PackageSnapshot)，克隆出的也没有
+    clean_parts = get_clean_parts(package)
+    if clean_parts is not None:
+        new_package.__dict__["_clean_parts"] = dict((new_part, clean_parts[part]) for part, new_part in cloned.items()
+                                                    if part in clean_parts)
+    return new_package
+
+
+def get_package_shared_parts(package):
+    """
+    package 中与其它 package 共用的 part(见 clone_package)，不是克隆出的 package 时为空
+    """
+    return package.__dict__.get("_shared_parts", frozenset())
+
+
+def make_parts_private(package, parts):
+    """
+    修改共享的 part 之前调用：在 package 中复制一份私有的 part，package 中所有指向它们的关系改为指向副本，
+    其它共用这些 part 的 package 不受影响
+    引用了这些 part 的共享 part 一起复制(比如母版的版式都引用母版)，否则保存时共享的版式仍指向原来的母版，写出两份同名的母版
+    :param package: clone_package 生成的 package
+    :param parts: 要修改的 part
+    :return: {原part: 副本}，不共享的 part 不复制，不在其中
+    """
+    shared_parts = get_package_shared_parts(package)
+    private_parts = set(part for part in parts if part in shared_parts)
+    if not private_parts:
+        return {}
+
+    referrers = {}
+    for part in shared_parts:
+        for rel in part.rels.values():
+            if not rel.is_external:
+                referrers.setdefault(rel.target_part, []).append(part)
+    stack = list(private_parts)
+    while stack:
+        for referrer in referrers.get(stack.pop(), ()):
+            if referrer not in private_parts:
+                private_parts.add(referrer)
+                stack.append(referrer)
+
+    live_parts = tuple(package.iter_parts())
+    copies = dict((part, _clone_part_object(part, package)) for part in private_parts)
+    for part, new_part in copies.items():
+        new_part.__dict__["_rels"] = _clone_rels(part.rels, part.partname.baseURI,
+                                                 lambda target: copies.get(target, target))
+
+    for rels in [package._rels] + [part.rels for part in live_parts if part not in copies]:
+        for rId, rel in list(rels.items()):
+            if not rel.is_external and rel.target_part in copies:
+                rels._rels[rId] = _Relationship(rels._base_uri, rId, rel.reltype, rel._target_mode,
+                                                copies[rel.target_part])
+
+    package.__dict__["_shared_parts"] = frozenset(shared_parts - private_parts)
+    return copies
+
+
+# Part 基类的 lazyproperty(关系、content_type、package)，子类其它的 lazyproperty 缓存的是 python-pptx 的代理对象
+# (slide、slide_layout、chart 等)
+PART_LAZYPROPERTIES = set(key for key in dir(Part) if isinstance(getattr(Part, key), lazyproperty))
+
+
+def is_part_touched(part):
+    """
+    part 上是否缓存了 python-pptx 的代理对象：通过 python-pptx 的接口修改 part 都要先取得代理对象
+    """
+    part_cls = type(part)
+    return any(key not in PART_LAZYPROPERTIES and isinstance(getattr(part_cls, key, None), lazyproperty)
+               for key in part.__dict__)
+
+
+def _get_rels_key(part):
+    return tuple((rId, rel.reltype, rel.target_ref if rel.is_external else rel.target_part)
+                 for rId, rel in part.rels.items())
+
+
+class SharedPartsGuard(object):
+    """
+    保存渲染实例前检查共享的 part(见 clone_package)没有被修改
+    共享的 part 被修改后模板和所有渲染实例都受影响，增量保存时还会写出与关系不一致的 xml
+    - 关系：比较 rId 和目标 part，每次保存都检查
+    - xml：只检查取过 python-pptx 代理对象的 part(见 is_part_touched)，比较序列化结果的签名；
+      不经过 python-pptx 直接修改 _element 的检查不出来
+    """
+
+    def __init__(self, shared_parts):
+        # {part: 关系}
+        self.rels = dict((part, _get_rels_key(part)) for part in shared_parts)
+        # {xml part: 序列化结果的签名}
+        self.signatures = dict((part, get_signature(part.blob)) for part in shared_parts if isinstance(part, XmlPart))
+
+    def check(self, package):
+        """
+        :param package: clone_package 生成的 package
+        :raise ValueError: 共享的 part 被修改
+        """
+        for part in get_package_shared_parts(package):
+            rels = self.rels.get(part)
+            if rels is None:
+                continue
+            if _get_rels_key(part) != rels or (
+                    part in self.signatures and is_part_touched(part) and
+                    get_signature(part.blob) != self.signatures[part]):
+                raise ValueError("shared part %s was modified, it is shared by every instance of the template; "
+                                 "call make_parts_private before modifying it" % part.partname)
+
+
+def clone_presentation(presentation, shared_parts=None):
+    """
+    克隆 Presentation 对象，见 clone_package
+    :param presentation:
+    :param shared_parts:
+    :return: 新的 Presentation 对象
+    """
+    new_package = clone_package(presentation.part.package, shared_parts)
+    return new_package.presentation_part.presentation
+
+
+def get_partname_template(partname):
+    """
+    根据 partname 得到 next_partname 使用的模板，比如 /ppt/charts/chart3.xml -> /ppt/charts/chart%d.xml
+    :param partname:
+    :return:
+    """
+    return re.sub(r"\d*(\.\w+)$", r"%d\1", partname.replace("%", "%%"))
+
+
+class PartnameAllocator(object):
+    """
+    为新 part 分配 partname，为新关系分配 rId，为新幻灯片分配 sldId 的 id
+    package 只在创建时遍历一次，之后每个 partname 模板、每个 rels 都从上次分配的编号接着往后找，
+    复制 N 页幻灯片的总开销是 O(N)，而 package.next_partname、relate_to、add_sldId 每次都要遍历全部 part、关系或幻灯片
+    创建时接管 package.next_partname、next_image_partname：python-pptx 之后添加的 part(add_chart、add_picture、
+    统计图 replace_data 生成的 xlsx、备注页等)也从分配器取名，分配器始终知道 package 中所有的 partname
+    一个 package 只使用一个分配器，用 get_partname_allocator 获取
+    注意：python-pptx 的 add_slide 不经过 next_partname，新幻灯片需要用 register_added_part 登记
+    """
+
+    def __init__(self, package):
+        self.partnames = set(part.partname for part in package.iter_parts())
+        # {partname 模板: 下一个候选编号}
+        self.next_numbers = {}
+        # {id(rels): 下一个候选 rId 编号}
+        self.next_rId_numbers = {}
+        self.next_slide_id = None
+        package.next_partname = self.next_partname
+        package.next_image_partname = self.next_image_partname
+        package.__dict__["_partname_allocator"] = self
+
+    def next_partname(self, tmpl):
+        """
+        :param tmpl: 比如 /ppt/charts/chart%d.xml
+        :return: PackURI
+        """
+        n = self.next_numbers.get(tmpl, 1)
+        while tmpl % n in self.partnames:
+            n += 1
+        self.next_numbers[tmpl] = n + 1
+        partname = PackURI(tmpl % n)
+        self.partnames.add(partname)
+        return partname
+
+    def next_image_partname(self, ext):
+        """
+        代替 package.next_image_partname，python-pptx 添加图片时使用
+        """
+        return self.next_partname("/ppt/media/image%d." + ext)
+
+    def register_part(self, part, tmpl):
+        """
+        登记不经过分配器添加的 part(比如 python-pptx 的 add_slide 添加的幻灯片)，与已有的 part 重名时重新命名
+        """
+        if part.partname in self.partnames:
+            part.partname = self.next_partname(tmpl)
+        else:
+            self.partnames.add(part.partname)
+
+    def next_rId(self, rels):
+        """
+        rels 中没有使用的 rId，编号从 rels 中最大的编号往后分配
+        """
+        n = self.next_rId_numbers.get(id(rels))
+        if n is None:
+            numbers = [int(rId[3:]) for rId in rels._rels if rId[3:].isdigit()]
+            n = max(numbers or [0]) + 1
+        while "rId%d" % n in rels._rels:
+            n += 1
+        self.next_rId_numbers[id(rels)] = n + 1
+        return "rId%d" % n
+
+    def relate_to(self, part, target_part, reltype):
+        """
+        与 part.relate_to 相同，但不查找已有的同一关系，只用于新建的 target_part
+        :return: rId
+        """
+        rels = part.rels
+        rId = self.next_rId(rels)
+        rels._rels[rId] = _Relationship(rels._base_uri, rId, reltype, RTM.INTERNAL, target_part)
+        return rId
+
+    def add_slide_id(self, sld_id_lst, rId, index=None):
+        """
+        与 sldIdLst.add_sldId 相同，id 取已有最大值加1，不再每次遍历所有的 sldId
+        :param index: 插入的位置，None 表示末尾
+        :return: p:sldId
+        """
+        if self.next_slide_id is None:
+            self.next_slide_id = max([255] + [int(sld_id.get("id")) for sld_id in sld_id_lst.sldId_lst]) + 1
+        # python-pptx 的 add_slide 可能已经用掉了这个 id
+        while sld_id_lst.xpath("p:sldId[@id='%d']" % self.next_slide_id):
+            self.next_slide_id += 1
+        sld_id = sld_id_lst._add_sldId(id=self.next_slide_id, rId=rId)
+        self.next_slide_id += 1
+        if index is not None:
+            sld_id_lst.insert(index, sld_id)
+        return sld_id
+
+
+def get_partname_allocator(package):
+    """
+    package 的 PartnameAllocator，第一次使用时创建
+    """
+    allocator = package.__dict__.get("_partname_allocator")
+    if allocator is None:
+        allocator = PartnameAllocator(package)
+    return allocator
+
+
+def register_added_part(package, part, tmpl):
+    """
+    python-pptx 不经过 next_partname 添加了 part 之后调用，见 PartnameAllocator.register_part
+    package 还没有分配器时不需要处理，之后创建分配器时会遍历到它
+    """
+    allocator = package.__dict__.get("_partname_allocator")
+    if allocator is not None:
+        allocator.register_part(part, tmpl)
+
+
+def duplicate_part(part, allocator):
+    """
+    在同一个 package 中复制 part，得到一个新 partname 的 part
+    PRIVATE_RELTYPES 关系指向的 part 递归复制，其它关系指向原来的 part(图片等不复制)，rId 保持不变，
+    因此 xml 中引用的 r:id 不需要修改
+    :param part:
+    :param allocator: PartnameAllocator
+    :return: 新的 part
+    """
+    package = part.package
+    new_part = _clone_part_object(part, package)
+    new_part._partname = allocator.next_partname(get_partname_template(part.partname))
+
+    base_uri = new_part.partname.baseURI
+    new_rels = _Relationships(base_uri)
+    for rId, rel in part.rels.items():
+        if rel.reltype in SKIPPED_RELTYPES:
+            continue
+        if rel.is_external:
+            target = rel.target_ref
+        elif rel.reltype in PRIVATE_RELTYPES:
+            target = duplicate_part(rel.target_part, allocator)
+        else:
+            target = rel.target_part
+        new_rels._rels[rId] = _Relationship(base_uri, rId, rel.reltype, rel._target_mode, target)
+    new_part.__dict__["_rels"] = new_rels
+
+    return new_part
+
+
+def duplicate_notes_slide(source_slide_part, slide_part, allocator):
+    """
+    复制备注页：备注页 xml 深复制，指向幻灯片的关系改为指向新幻灯片，备注母版共用
+    新幻灯片指向备注页的关系使用与原幻灯片相同的 rId
+    :param source_slide_part: 原幻灯片part
+    :param slide_part: duplicate_part 复制出的新幻灯片part
+    :param allocator: PartnameAllocator
+    :return: 新的备注页part，原幻灯片没有备注页时为 None
+    """
+    for rId, rel in source_slide_part.rels.items():
+        if rel.reltype == RT.NOTES_SLIDE and not rel.is_external:
+            break
+    else:
+        return None
+
+    notes_part = duplicate_part(rel.target_part, allocator)
+    notes_rels = notes_part.rels
+    for notes_rId, notes_rel in list(notes_rels.items()):
+        if notes_rel.reltype == RT.SLIDE:
+            notes_rels._rels[notes_rId] = _Relationship(notes_rels._base_uri, notes_rId, RT.SLIDE, RTM.INTERNAL,
+                                                        slide_part)
+
+    slide_rels = slide_part.rels
+    slide_rels._rels[rId] = _Relationship(slide_rels._base_uri, rId, RT.NOTES_SLIDE, RTM.INTERNAL, notes_part)
+    return notes_part
+
+
+def duplicate_slide(presentation, source_index, target_index, allocator=None, notes=True):
+    """
+    复制幻灯片：幻灯片 xml(整个 spTree)深复制一次，关系的 rId 保持不变，xml 中的 r:id、r:embed 不需要修改
+    统计图连同内嵌的 xlsx、样式一起复制，备注页复制，图片、版式、超链接等共用原来的 part
+    :param presentation:
+    :param source_index: 被复制的幻灯片索引
+    :param target_index: 新幻灯片插入的位置
+    :param allocator: PartnameAllocator，为 None 时使用 get_partname_allocator(package)
+    :param notes: 是否复制备注页
+    :return: 新的幻灯片
+    """
+    if allocator is None:
+        allocator = get_partname_allocator(presentation.part.package)
+    slides = presentation.slides
+    source_part = slides[source_index].part
+
+    slide_part = duplicate_part(source_part, allocator)
+    if notes:
+        duplicate_notes_slide(source_part, slide_part, allocator)
+    rId = allocator.relate_to(presentation.part, slide_part, RT.SLIDE)
+    allocator.add_slide_id(slides._sldIdLst, rId, target_index)
+    mark_dirty(presentation.part)
+
+    return slide_part.slide
+
+
+TAG_SLD_LAYOUT_ID = qn("p:sldLayoutId")
+
+
+def is_media_part(part):
+    """
+    图片、音视频：合并演示文稿时按内容去重
+    """
+    return not isinstance(part, XmlPart) and part.content_type.startswith(("image/", "video/", "audio/"))
+
+
+class DeckMerger(object):
+    """
+    把多个演示文稿的幻灯片依次追加到目标演示文稿中
+    - 图片、音视频按内容的 sha1 去重，所有演示文稿中相同的图片只保存一份
+    - 版式按内容(连同母版、主题、图片)对应到目标中相同的版式，母版相同而版式不同时把版式加到目标的母版中，
+      母版也不同时整个母版连同它的版式一起复制过来
+    - 统计图、内嵌xlsx、备注页等其它 part 复制；备注页使用目标的备注母版
+    - 源演示文稿不被修改，追加完就可以释放，适合逐个加载、逐个追加
+    - 目标中与其它 package 共享的母版(clone_package)在修改前复制一份私有的，见 make_parts_private
+    """
+
+    def __init__(self, presentation, allocator=None):
+        """
+        :param presentation: 目标演示文稿
+        :param allocator: PartnameAllocator，为 None 时新建
+        """
+        self.presentation = presentation
+        self.presentation_part = presentation.part
+        self.package = presentation.part.package
+        self.allocator = allocator or get_partname_allocator(self.package)
+
+        # {(content_type, sha1): 目标中的图片等part}
+        self.media_index = {}
+        # {签名: 目标中的版式part}、{签名: 目标中的母版part}
+        self.layout_index = {}
+        self.master_index = {}
+        # 正在复制的源母版，它的版式随母版一起复制，不再单独登记
+        self.importing_masters = set()
+
+        signatures = {}
+        for part in self.package.iter_parts():
+            if is_media_part(part):
+                self.media_index.setdefault((part.content_type, hashlib.sha1(part.blob).hexdigest()), part)
+
+        # 母版、版式的 id 在同一个范围内(从 2147483648 开始)，必须唯一
+        ids = [int(sld_master_id.get("id")) for sld_master_id in self.get_sld_master_id_lst()]
+        for master in presentation.slide_masters:
+            self.master_index.setdefault(self.get_signature(master.part, signatures), master.part)
+            ids.extend(int(sld_layout_id.get("id")) for sld_layout_id in master.part._element.iter(TAG_SLD_LAYOUT_ID))
+            for layout in master.slide_layouts:
+                self.layout_index.setdefault(self.get_signature(layout.part, signatures), layout.part)
+        self.next_master_id = max([2147483647] + ids) + 1
+
+    def get_sld_master_id_lst(self):
+        return self.presentation_part._element.get_or_add_sldMasterIdLst()
+
+    def get_notes_master_part(self):
+        """
+        目标的备注母版，没有时由 python-pptx 创建默认的备注母版，新 part 的名称登记到分配器中
+        """
+        has_notes_master = any(rel.reltype == RT.NOTES_MASTER for rel in self.presentation_part.rels.values())
+        notes_master_part = self.presentation_part.notes_master_part
+        if not has_notes_master:
+            self.allocator.partnames.add(notes_master_part.partname)
+            for rel in notes_master_part.rels.values():
+                if not rel.is_external:
+                    self.allocator.partnames.add(rel.target_part.partname)
+        return notes_master_part
+
+    def get_signature(self, part, signatures):
+        """
+        part 的内容签名：自身的内容加上它引用的 part 的签名，母版不计入它的版式(版式的签名包含母版)
+        :param signatures: {part: 签名} 缓存
+        :return: sha1 的十六进制字符串
+        """
+        signature = signatures.get(part)
+        if signature is not None:
+            return signature
+
+        sha1 = hashlib.sha1(part.content_type.encode("utf-8"))
+        sha1.update(part.blob)
+        for rId, rel in sorted(part.rels.items()):
+            if rel.reltype == RT.SLIDE_LAYOUT:
+                continue
+            sha1.update(("%s %s " % (rId, rel.reltype)).encode("utf-8"))
+            if rel.is_external:
+                sha1.update(rel.target_ref.encode("utf-8"))
+            else:
+                sha1.update(self.get_signature(rel.target_part, signatures).encode("utf-8"))
+
+        signature = signatures[part] = sha1.hexdigest()
+        return signature
+
+    def append(self, source_presentation):
+        """
+        把 source_presentation 的所有幻灯片按顺序追加到目标演示文稿的末尾
+        :param source_presentation: 源演示文稿，不会被修改
+        :return: [新的幻灯片part]
+        """
+        # 本次追加中 源part -> 目标part，幻灯片之间的超链接也通过它对应到新的幻灯片
+        imported = {}
+        signatures = {}
+        sld_id_lst = self.presentation.slides._sldIdLst
+
+        slide_parts = []
+        for slide in source_presentation.slides:
+            slide_part = self.import_part(slide.part, imported, signatures)
+            rId = self.allocator.relate_to(self.presentation_part, slide_part, RT.SLIDE)
+            self.allocator.add_slide_id(sld_id_lst, rId)
+            slide_parts.append(slide_part)
+        mark_dirty(self.presentation_part)
+        return slide_parts
+
+    def import_part(self, part, imported, signatures):
+        """
+        把源 part 导入目标 package，见 DeckMerger
+        :return: 目标中的 part
+        """
+        target = imported.get(part)
+        if target is not None:
+            return target
+
+        content_type = part.content_type
+        if content_type == CT.PML_SLIDE_LAYOUT:
+            target = self.import_layout(part, imported, signatures)
+        elif content_type == CT.PML_SLIDE_MASTER:
+            target = self.import_master(part, imported, signatures)
+        elif content_type == CT.PML_NOTES_MASTER:
+            target = self.get_notes_master_part()
+        elif is_media_part(part):
+            key = (content_type, hashlib.sha1(part.blob).hexdigest())
+            target = self.media_index.get(key)
+            if target is None:
+                target = self.media_index[key] = self._copy_part(part, imported, signatures)
+        else:
+            target = self._copy_part(part, imported, signatures)
+
+        imported[part] = target
+        return target
+
+    def _copy_part(self, part, imported, signatures, rel_targets=None):
+        """
+        复制 part 到目标 package，它引用的 part 递归导入
+        :param rel_targets: {reltype: 目标part}，这些关系直接指向给定的 part，不导入
+        """
+        new_part = _clone_part_object(part, self.package)
+        new_part._partname = self.allocator.next_partname(get_partname_template(part.partname))
+        # 先登记再处理 rels，relationship 存在环(比如 notesSlide -> slide)
+        imported[part] = new_part
+
+        base_uri = new_part.partname.baseURI
+        new_rels = _Relationships(base_uri)
+        for rId, rel in part.rels.items():
+            if rel.is_external:
+                target = rel.target_ref
+            elif rel_targets and rel.reltype in rel_targets:
+                target = rel_targets[rel.reltype]
+            else:
+                target = self.import_part(rel.target_part, imported, signatures)
+            new_rels._rels[rId] = _Relationship(base_uri, rId, rel.reltype, rel._target_mode, target)
+        new_part.__dict__["_rels"] = new_rels
+        return new_part
+
+    def import_layout(self, layout_part, imported, signatures):
+        """
+        目标中有相同的版式时直接使用；母版相同时把版式加到目标的母版中；否则复制整个母版
+        """
+        master_part = layout_part.part_related_by(RT.SLIDE_MASTER)
+        if master_part in self.importing_masters:
+            return self._copy_part(layout_part, imported, signatures)
+
+        target = self.layout_index.get(self.get_signature(layout_part, signatures))
+        if target is not None:
+            return target
+
+        target_master = imported.get(master_part)
+        if target_master is None:
+            target_master = self.master_index.get(self.get_signature(master_part, signatures))
+        if target_master is None:
+            # 复制母版时它的版式一起复制
+            self.import_master(master_part, imported, signatures)
+            return imported[layout_part]
+
+        # 目标是 CompiledTemplate 的渲染实例时母版与其它实例共享，先换成私有的副本再修改
+        target_master = self.make_private(target_master, imported)
+        target = self._copy_part(layout_part, imported, signatures, {RT.SLIDE_MASTER: target_master})
+        rId = self.allocator.relate_to(target_master, target, RT.SLIDE_LAYOUT)
+        sld_layout_id_lst = target_master._element.get_or_add_sldLayoutIdLst()
+        etree.SubElement(sld_layout_id_lst, TAG_SLD_LAYOUT_ID, {"id": str(self.next_master_id), qn("r:id"): rId})
+        self.next_master_id += 1
+        self.layout_index[self.get_signature(layout_part, signatures)] = target
+        return target
+
+    def make_private(self, part, imported):
+        """
+        修改目标中的 part 之前调用，见 make_parts_private；索引和本次追加中对应到被复制的 part 的都换成副本
+        :param imported: 本次追加的 源part -> 目标part
+        :return: 可以修改的 part
+        """
+        copies = make_parts_private(self.package, [part])
+        for index in (self.media_index, self.layout_index, self.master_index, imported):
+            for key, value in list(index.items()):
+                if value in copies:
+                    index[key] = copies[value]
+        return copies.get(part, part)
+
+    def import_master(self, master_part, imported, signatures):
+        """
+        复制母版及其所有版式，登记到目标的 sldMasterIdLst，版式 id 重新编号
+        """
+        self.importing_masters.add(master_part)
+        try:
+            target_master = self._copy_part(master_part, imported, signatures)
+        finally:
+            self.importing_masters.discard(master_part)
+        for rel in master_part.rels.values():
+            if rel.reltype == RT.SLIDE_LAYOUT:
+                self.layout_index.setdefault(self.get_signature(rel.target_part, signatures),
+                                             imported[rel.target_part])
+        self.master_index.setdefault(self.get_signature(master_part, signatures), target_master)
+
+        rId = self.allocator.relate_to(self.presentation_part, target_master, RT.SLIDE_MASTER)
+        etree.SubElement(self.get_sld_master_id_lst(), qn("p:sldMasterId"),
+                         {"id": str(self.next_master_id), qn("r:id"): rId})
+        self.next_master_id += 1
+        for sld_layout_id in target_master._element.iter(TAG_SLD_LAYOUT_ID):
+            sld_layout_id.set("id", str(self.next_master_id))
+            self.next_master_id += 1
+        return target_master
+
+
+# 幻灯片分节(p14:sectionLst)中按 sldId 的 id 引用幻灯片
+SECTION_SLD_ID_XPATH = etree.XPath("//p14:sldId",
+                                   namespaces={"p14": "http://schemas.microsoft.com/office/powerpoint/2010/main"})
+# 引用某个关系的元素
+RID_REFERENCE_XPATH = etree.XPath("//*[@r:id=$rId]", namespaces=namespaces("r"))
+
+
+def iter_live_parts(package, dead_parts):
+    """
+    从 package 的关系出发能到达的 part，不经过 dead_parts
+    :param package:
+    :param dead_parts: 已经删除的 part 集合
+    :return: part 的生成器
+    """
+    visited = set(dead_parts)
+    stack = [package._rels]
+    while stack:
+        for rel in stack.pop().values():
+            if rel.is_external:
+                continue
+            part = rel.target_part
+            if part in visited:
+                continue
+            visited.add(part)
+            yield part
+            stack.append(part.rels)
+
+
+def drop_links_to_parts(package, dead_parts):
+    """
+    删除其它 part 中指向 dead_parts 的关系(幻灯片间的超链接、自定义放映等)，连同引用它们的元素
+    否则被删除的幻灯片仍然可以通过这些关系到达，保存时还会写出
+    :param package:
+    :param dead_parts:
+    :return:
+    """
+    for part in iter_live_parts(package, dead_parts):
+        dead_rIds = [rId for rId, rel in part.rels.items() if not rel.is_external and rel.target_part in dead_parts]
+        for rId in dead_rIds:
+            for element in RID_REFERENCE_XPATH(part._element, rId=rId):
+                element.getparent().remove(element)
+            part._rels.pop(rId)
+        if dead_rIds:
+            mark_dirty(part)
+
+
+def delete_slides(presentation, indexes, drop_links=True):
+    """
+    删除幻灯片：sldId 和 presentation 到幻灯片的关系一起删除
+    保存时只写出还能到达的 part(iter_parts)，被删幻灯片独有的统计图、内嵌xlsx、图片、备注页不再写出
+    :param presentation:
+    :param indexes: 幻灯片顺序索引
+    :param drop_links: 是否同时调用 drop_links_to_parts，它要遍历整个 package；
+                       多次删除时可以传 False，最后对所有被删除的幻灯片调用一次
+    :return: 被删除的幻灯片 part 集合
+    """
+    # sldIdLst 只遍历一次，lxml 按序号取子元素是线性查找
+    presentation_part = presentation.part
+    sld_id_lst = presentation.slides._sldIdLst
+    all_sld_ids = list(sld_id_lst)
+    sld_ids = [all_sld_ids[index] for index in set(indexes)]
+
+    dead_ids = set(str(sld_id.id) for sld_id in sld_ids)
+    for section_sld_id in SECTION_SLD_ID_XPATH(presentation_part._element):
+        if section_sld_id.get("id") in dead_ids:
+            section_sld_id.getparent().remove(section_sld_id)
+
+    dead_parts = set()
+    for sld_id in sld_ids:
+        dead_parts.add(presentation_part.related_part(sld_id.rId))
+        sld_id_lst.remove(sld_id)
+        presentation_part._rels.pop(sld_id.rId)
+    mark_dirty(presentation_part)
+
+    if drop_links:
+        drop_links_to_parts(presentation_part.package, dead_parts)
+    return dead_parts
+
+
+def get_signature(blob):
+    """
+    判断 xml 是否改变用的签名：长度和 sha1
+    签名相同就直接复制原 zip 中的成员，crc32 这样的校验和可能碰撞，会把改变了的 xml 当成没有改变
+    """
+    return len(blob), hashlib.sha1(blob).digest()
+
+
+def get_rels_signature(rels):
+    """
+    rels 序列化结果的签名
+    _Relationship.target_ref 是 lazyproperty，直接序列化会缓存目标现在的名称，之后 python-pptx 按顺序给幻灯片重新命名
+    (Presentation.slides)时仍写出旧名称，这里序列化一份副本
+    """
+    return get_signature(_clone_rels(rels, rels._base_uri, lambda part: part).xml)
+
+
+def copy_raw_member(zip_file, source_bytes, info, arcname=None):
+    """
+    把另一个 zip 中已经压缩好的成员原样写入 zip_file，不解压、不重新压缩
+    zipfile 没有公开这样的接口，这里按 ZipFile.writestr 的方式直接写本地文件头和数据，
+    并维护 ZipFile 的内部状态(fp、filelist、NameToInfo、start_dir 等)，只有这个函数依赖 zipfile 的内部实现
+    :param zip_file: 以 "w" 方式打开的 ZipFile
+    :param source_bytes: 另一个 zip 文件的 bytes
+    :param info: 成员在 source_bytes 中的 ZipInfo
+    :param arcname: 写入 zip_file 的成员名，None 表示与原成员同名
+    :return:
+    """
+    offset = info.header_offset
+    name_length, extra_length = struct.unpack("<HH", source_bytes[offset + 26:offset + 30])
+    start = offset + 30 + name_length + extra_length
+
+    zinfo = zipfile.ZipInfo(arcname or info.filename, info.date_time)
+    zinfo.compress_type = info.compress_type
+    zinfo.external_attr = info.external_attr
+    # 只保留压缩选项，CRC 和大小直接写在本地文件头中，不使用数据描述符(0x08)
+    zinfo.flag_bits = info.flag_bits & 0x06
+    zinfo.CRC = info.CRC
+    zinfo.compress_size = info.compress_size
+    zinfo.file_size = info.file_size
+    zip64 = max(zinfo.file_size, zinfo.compress_size) > zipfile.ZIP64_LIMIT
+
+    with zip_file._lock:
+        if zip_file._seekable:
+            zip_file.fp.seek(zip_file.start_dir)
+        zinfo.header_offset = zip_file.fp.tell()
+        zip_file._writecheck(zinfo)
+        zip_file._didModify = True
+        zip_file.fp.write(zinfo.FileHeader(zip64))
+        zip_file.fp.write(memoryview(source_bytes)[start:start + info.compress_size])
+        zip_file.filelist.append(zinfo)
+        zip_file.NameToInfo[zinfo.filename] = zinfo
+        zip_file.start_dir = zip_file.fp.tell()
+
+
+def get_clean_parts(package):
+    """
+    package 中快照(见 PackageSnapshot)之后没有修改过的 xml part
+    :return: {part: 快照中的 zip 成员名}，python-pptx 会按幻灯片顺序给幻灯片重新命名，成员名不一定还是 part 现在的名称；
+             package 没有快照时为 None
+    """
+    return package.__dict__.get("_clean_parts")
+
+
+def mark_dirty(part):
+    """
+    不经过 python-pptx 的代理对象修改了 part 的 xml 之后调用，保存时直接重新压缩，见 PackageSnapshot
+    """
+    clean_parts = get_clean_parts(part.package)
+    if clean_parts is not None:
+        clean_parts.pop(part, None)
+
+
+class PackageSnapshot(object):
+    """
+    渲染前 package 的快照，增量保存(save_package)时据此判断 zip 成员是否改变，没有改变的直接复制原 zip 中压缩好的数据
+    - 可共享的 part(见 is_shareable_part)在渲染时只读，仍是原来的对象就没有改变，不需要序列化
+    - 其它二进制 part(内嵌的 xlsx 等)比较 blob 是否还是原来的 bytes 对象
+    - 其它 xml part 按 package 中记录的修改情况(见 get_clean_parts)分三种：
+      没有修改过、也没有取过 python-pptx 代理对象(见 is_part_touched)的不序列化，直接复制快照中的成员；
+      mark_dirty 登记过的直接重新压缩；取过代理对象的序列化后比较签名
+    - rels、[Content_Types].xml 的内容与 part 的名称有关，都比较签名
+    渲染时只改了几页的大模板，保存时只序列化这几页
+    """
+
+    def __init__(self, package):
+        pkg_file = package._pkg_file
+        if isinstance(pkg_file, str):
+            with open(pkg_file, "rb") as f:
+                self.zip_bytes = f.read()
+        else:
+            pkg_file.seek(0)
+            self.zip_bytes = pkg_file.read()
+
+        with zipfile.ZipFile(io.BytesIO(self.zip_bytes)) as zip_file:
+            self.infos = dict((info.filename, info) for info in zip_file.infolist())
+
+        parts = tuple(package.iter_parts())
+        # partname -> 快照时的 part 对象
+        self.parts = {}
+        # partname -> 快照时二进制 part 的 blob
+        self.blobs = {}
+        # zip 成员名 -> 快照时 xml 序列化结果的签名
+        self.signatures = {
+            CONTENT_TYPES_URI.membername: get_signature(serialize_part_xml(_ContentTypesItem.xml_for(parts))),
+            PACKAGE_URI.rels_uri.membername: get_rels_signature(package._rels),
+        }
+
+        clean_parts = {}
+        for part in parts:
+            partname = part.partname
+            self.parts[partname] = part
+            if part._rels:
+                self.signatures[partname.rels_uri.membername] = get_rels_signature(part.rels)
+            if is_shareable_part(part):
+                continue
+            if isinstance(part, XmlPart):
+                self.signatures[partname.membername] = get_signature(part.blob)
+                clean_parts[part] = partname.membername
+            else:
+                self.blobs[partname] = part.blob
+        package.__dict__["_clean_parts"] = clean_parts
+
+    def refresh(self, package):
+        """
+        快照之后修改了 package(比如合并被拆分的标签)，又要克隆它时调用(克隆出的 part 沿用原 part 的修改情况)
+        取过代理对象的 part 重新比较签名，改变了的 xml 重新压缩，替换快照中的成员，
+        之后克隆出的 part 没有修改时仍然直接复制
+        """
+        changed = {}
+        for part, source in get_clean_parts(package).items():
+            if not is_part_touched(part):
+                continue
+            blob = part.blob
+            signature = get_signature(blob)
+            if self.signatures.get(source) != signature:
+                self.signatures[source] = signature
+                changed[source] = blob
+        if not changed:
+            return
+
+        stream = io.BytesIO()
+        with zipfile.ZipFile(stream, "w", zipfile.ZIP_DEFLATED) as zip_file:
+            for membername, info in self.infos.items():
+                if membername not in changed:
+                    copy_raw_member(zip_file, self.zip_bytes, info)
+            for membername, blob in changed.items():
+                zip_file.writestr(membername, blob)
+        self.zip_bytes = stream.getvalue()
+        with zipfile.ZipFile(io.BytesIO(self.zip_bytes)) as zip_file:
+            self.infos = dict((info.filename, info) for info in zip_file.infolist())
+
+    def copy_member(self, zip_file, membername, arcname=None):
+        """
+        把原 zip 中的成员原样复制到 zip_file
+        :param arcname: 写入 zip_file 的成员名，None 表示同名
+        :return: 原 zip 中没有这个成员时返回 False
+        """
+        info = self.infos.get(membername)
+        if info is None:
+            return False
+        copy_raw_member(zip_file, self.zip_bytes, info, arcname)
+        return True
+
+    def write_xml(self, zip_file, membername, blob, source=None):
+        """
+        xml 与快照时相同则复制原 zip 中的成员，否则重新压缩写入
+        :param source: 与快照中哪个成员比较，None 表示同名的成员
+        """
+        source = source or membername
+        if self.signatures.get(source) == get_signature(blob) and self.copy_member(zip_file, source, membername):
+            return
+        zip_file.writestr(membername, blob)
+
+    def write_part(self, zip_file, part, clean_parts=None):
+        """
+        写出 part 和它的 rels
+        :param clean_parts: get_clean_parts 的结果，为 None 时所有 xml 都比较签名
+        """
+        partname = part.partname
+        membername = partname.membername
+        if self.parts.get(partname) is part and is_shareable_part(part):
+            if not self.copy_member(zip_file, membername):
+                zip_file.writestr(membername, part.blob)
+        elif isinstance(part, XmlPart):
+            source = membername if clean_parts is None else clean_parts.get(part)
+            if source is None:
+                zip_file.writestr(membername, part.blob)
+            elif clean_parts is not None and not is_part_touched(part) and \
+                    self.copy_member(zip_file, source, membername):
+                pass
+            else:
+                self.write_xml(zip_file, membername, part.blob, source)
+        elif self.blobs.get(partname) is part.blob and self.copy_member(zip_file, membername):
+            pass
+        else:
+            zip_file.writestr(membername, part.blob)
+        if part._rels:
+            self.write_xml(zip_file, partname.rels_uri.membername, part.rels.xml)
+
+
+def _write_xml(zip_file, snapshot, membername, blob):
+    if snapshot is None:
+        zip_file.writestr(membername, blob)
+    else:
+        snapshot.write_xml(zip_file, membername, blob)
+
+
+def save_package(package, pkg_file, snapshot=None, compression=zipfile.ZIP_DEFLATED, compresslevel=None):
+    """
+    保存 package，写出的内容与 package.save 相同，可以选择压缩方式
+    有快照时增量保存：没有改变的 zip 成员直接复制压缩好的数据(见 PackageSnapshot)，保持原模板中的压缩方式，
+    保存耗时只与渲染改变的部分有关，与模板中图片、音视频以及没有渲染的幻灯片的多少无关
+    :param package:
+    :param pkg_file: 路径或者可写的二进制文件对象
+    :param snapshot: PackageSnapshot，通常在模板加载后、渲染前创建；为 None 时所有成员重新压缩
+    :param compression: zipfile.ZIP_STORED(不压缩，最快)或 zipfile.ZIP_DEFLATED
+    :param compresslevel: ZIP_DEFLATED 的压缩级别 0-9，None 表示 zlib 的默认级别
+    :return:
+    """
+    parts = tuple(package.iter_parts())
+    clean_parts = get_clean_parts(package)
+    with zipfile.ZipFile(pkg_file, "w", compression=compression, compresslevel=compresslevel) as zip_file:
+        _write_xml(zip_file, snapshot, CONTENT_TYPES_URI.membername,
+                   serialize_part_xml(_ContentTypesItem.xml_for(parts)))
+        _write_xml(zip_file, snapshot, PACKAGE_URI.rels_uri.membername, package._rels.xml)
+        for part in parts:
+            if snapshot is not None:
+                snapshot.write_part(zip_file, part, clean_parts)
+                continue
+            zip_file.writestr(part.partname.membername, part.blob)
+            if part._rels:
+                zip_file.writestr(part.partname.rels_uri.membername, part.rels.xml)
@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+"""
+批量渲染：一个模板，多条记录，每条记录输出一个pptx，多进程并行
+
+模板的内容只发送给每个工作进程一次，工作进程中预编译模板，之后每条记录只需要克隆渲染实例
+单条记录渲染失败不影响其它记录，错误信息随结果返回
+
+命令行：python render_batch.py template.pptx records.jsonl out_dir --workers 32
+"""
+import os
+import io
+import sys
+import json
+import zipfile
+import argparse
+import traceback
+import collections
+import concurrent.futures
+
+import pptxtpl
+import inventory
+
+
+# index: 记录在 records 中的序号；path: 输出文件路径；error: 渲染失败时的错误信息，成功时为 None
+RenderResult = collections.namedtuple("RenderResult", ["index", "name", "path", "error"])
+
+
+def render_record(pptx_obj, record):
+    """
+    默认的记录渲染方式，record 的格式如下，除了 index 都是可选的：
+    {
+        "name": "一班.pptx",
+        "slides": [
+            {
+                "index": 0,
+                "context": {"students": [{"name": "zzz", "age": 90}], "show_note": true},
+                "replace_data": {"{name0}": "zzz", "{age0}": 90},
+                "table_data": [[1, "zzz", 90]],
+                "image_data": {"{photo}": "photos/zzz.jpg"},
+                "title_data": {"{grade_title}": {"category": ["不及格", "及格"], "data": {"一班": [20, 80]}}},
+                "title_replace": {"{grade_title}": "一班及格人数柱状图"},
+                "chart_workbook": "lazy",
+                "delete_shapes": true
+            }
+        ]
+    }
+    :param pptx_obj: PPTXTemplate
+    :param record:
+    :return:
+    """
+    for slide_data in record.get("slides", []):
+        index = slide_data["index"]
+        if "context" in slide_data:
+            pptx_obj.render_blocks(index, slide_data["context"])
+        if "replace_data" in slide_data:
+            pptx_obj.replace_data(index, slide_data["replace_data"])
+        if "table_data" in slide_data:
+            pptx_obj.add_table_data(index, slide_data["table_data"])
+        if "image_data" in slide_data:
+            pptx_obj.replace_images(index, slide_data["image_data"])
+        if "title_data" in slide_data:
+            pptx_obj.replace_bar_chart_data(index, slide_data["title_data"], slide_data.get("title_replace", {}),
+                                            slide_data.get("chart_workbook", pptxtpl.CHART_WORKBOOK_NOW))
+        if slide_data.get("delete_shapes"):
+            pptx_obj.delete_shapes(index)
+
+
+def get_record_name(index, record):
+    """
+    输出文件名，只能是 out_dir 中的文件名：不能是绝对路径，不能含有路径分隔符或者 ..
+    :return:
+    """
+    name = record.get("name") or "%d.pptx" % index
+    if not isinstance(name, str) or "/" in name or "\\" in name or name in (".", "..") or os.path.isabs(name):
+        raise ValueError("invalid record name: %r" % (name,))
+    return name
+
+
+# 工作进程中的预编译模板，由 _init_worker 创建
+_worker_state = {}
+
+
+def _init_worker(template_blob, label_format, render_func, compression=zipfile.ZIP_DEFLATED, compresslevel=None):
+    _worker_state["compiled_template"] = pptxtpl.CompiledTemplate(io.BytesIO(template_blob), label_format)
+    _worker_state["render_func"] = render_func
+    _worker_state["compression"] = (compression, compresslevel)
+
+
+def _render_one(index, record, out_dir):
+    name = None
+    try:
+        name = get_record_name(index, record)
+        path = os.path.join(out_dir, name)
+        pptx_obj = _worker_state["compiled_template"].new_template()
+        _worker_state["render_func"](pptx_obj, record)
+        pptx_obj.save(path, *_worker_state["compression"])
+        return RenderResult(index, name, path, None)
+    except Exception:
+        return RenderResult(index, name, None, traceback.format_exc())
+
+
+def _validate_one(template_inventory, index, record):
+    """
+    渲染前校验记录，不通过时返回失败的 RenderResult，通过时返回 None
+    """
+    errors = inventory.validate_record(template_inventory, record)
+    if not errors:
+        return None
+    return RenderResult(index, get_record_name(index, record), None, "invalid record:\n%s\n" % "\n".join(errors))
+
+
+def _check_name(index, record, used_names):
+    """
+    检查输出文件名，不合法或者与之前的记录重名(会覆盖之前的输出)时返回失败的 RenderResult，通过时返回 None
+    :param used_names: 已经使用的文件名(按 os.path.normcase 统一大小写)，通过时加入
+    """
+    try:
+        name = get_record_name(index, record)
+    except ValueError as e:
+        return RenderResult(index, record.get("name"), None, "%s\n" % e)
+    key = os.path.normcase(name)
+    if key in used_names:
+        return RenderResult(index, name, None, "duplicate record name: %s\n" % name)
+    used_names.add(key)
+    return None
+
+
+def _check_one(template_inventory, index, record, used_names):
+    """
+    分发前检查一条记录(文件名，有模板清单时校验记录)，不通过时返回失败的 RenderResult，通过时返回 None
+    与 _render_one 一样，检查时的任何异常只影响这一条记录(比如 record 不是 dict)
+    """
+    try:
+        return _check_name(index, record, used_names) or \
+            (template_inventory and _validate_one(template_inventory, index, record)) or None
+    except Exception:
+        name = record.get("name") if isinstance(record, dict) else None
+        return RenderResult(index, name, None, traceback.format_exc())
+
+
+def render_many(template, records, out_dir, workers=None, render_func=render_record, label_format="{%s}",
+                compression=zipfile.ZIP_DEFLATED, compresslevel=None, template_inventory=None):
+    """
+    批量渲染，按完成的先后顺序逐条返回结果
+    records 可以是生成器，任何时候最多只有 workers * 4 条记录在处理中
+    :param template: 模板路径或者模板的 bytes
+    :param records: 记录的可迭代对象，格式见 render_record
+    :param out_dir: 输出目录
+    :param workers: 进程数，默认是cpu核数；为1时在当前进程中渲染
+    :param render_func: render_func(pptx_obj, record)，必须是模块级的函数，以便传给工作进程
+    :param label_format: 替换标签的格式
+    :param compression: 输出文件的压缩方式，见 PPTXTemplate.save
+    :param compresslevel: 压缩级别
+    :param template_inventory: 模板清单(见 inventory.build_inventory)，传入时先校验每条记录，
+                               不通过的记录直接返回错误，不交给工作进程渲染
+    输出文件名不合法(见 get_record_name)或者与之前的记录重名的记录同样直接返回错误
+    :return: RenderResult 的生成器
+    """
+    if isinstance(template, bytes):
+        template_blob = template
+    else:
+        with open(template, "rb") as f:
+            template_blob = f.read()
+
+    if not os.path.exists(out_dir):
+        os.makedirs(out_dir)
+
+    workers = workers or os.cpu_count() or 1
+    initargs = (template_blob, label_format, render_func, compression, compresslevel)
+    used_names = set()
+
+    if workers == 1:
+        _init_worker(*initargs)
+        for index, record in enumerate(records):
+            invalid = _check_one(template_inventory, index, record, used_names)
+            yield invalid or _render_one(index, record, out_dir)
+        return
+
+    max_pending = workers * 4
+    with concurrent.futures.ProcessPoolExecutor(workers, initializer=_init_worker, initargs=initargs) as executor:
+        pending = set()
+        for index, record in enumerate(records):
+            invalid = _check_one(template_inventory, index, record, used_names)
+            if invalid:
+                yield invalid
+                continue
+            pending.add(executor.submit(_render_one, index, record, out_dir))
+            if len(pending) < max_pending:
+                continue
+            done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+        for future in concurrent.futures.as_completed(pending):
+            yield future.result()
+
+
+def iter_jsonl(path):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="根据 jsonl 中的每条记录渲染一个 pptx")
+    parser.add_argument("template", help="pptx 模板")
+    parser.add_argument("records", help="jsonl 文件，每行一条记录，格式见 render_batch.render_record")
+    parser.add_argument("out_dir", help="输出目录")
+    parser.add_argument("--workers", type=int, default=None, help="进程数，默认是cpu核数")
+    parser.add_argument("--stored", action="store_true", help="输出文件不压缩，保存更快，文件更大")
+    parser.add_argument("--compresslevel", type=int, default=None, help="压缩级别 0-9")
+    parser.add_argument("--validate", action="store_true", help="渲染前用模板清单校验每条记录")
+    parser.add_argument("--inventory", help="缓存的模板清单(inventory.py 的输出)，指定时不再扫描模板，隐含 --validate")
+    args = parser.parse_args(argv)
+
+    template_inventory = None
+    if args.inventory:
+        template_inventory = inventory.load_inventory(args.inventory)
+        if not inventory.is_inventory_of(template_inventory, args.template):
+            sys.stderr.write("inventory %s does not match template %s\n" % (args.inventory, args.template))
+            return 2
+    elif args.validate:
+        template_inventory = inventory.build_inventory(args.template)
+
+    compression = zipfile.ZIP_STORED if args.stored else zipfile.ZIP_DEFLATED
+    failed = 0
+    for result in render_many(args.template, iter_jsonl(args.records), args.out_dir, workers=args.workers,
+                              compression=compression, compresslevel=args.compresslevel,
+                              template_inventory=template_inventory):
+        if result.error:
+            failed += 1
+            sys.stderr.write("record %d (%s) failed:\n%s\n" % (result.index, result.name, result.error))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,444 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+"""
+块渲染计划：模板中的 {% for %}、{% if %} 块编译一次，之后每次渲染只执行计划，不再扫描幻灯片
+
+块标记可以用在三个层次，标记本身独占一个元素，渲染后删除：
+- 图形：文本只有块标记的文本框，块中的图形(包括组合图形)按循环复制，每次向下移动整个块的高度
+- 段落：文本框、表格单元格中文本只有块标记的段落，块中的段落按循环复制
+- 表格行：所有单元格的文本合起来只有块标记的行，块中的行按循环复制，表格高度随之更新
+
+    {% for student in students %}
+    {student.name}：{student.age}岁，第{loop.index}名
+    {% endfor %}
+    {% if show_note %}……{% else %}……{% endif %}
+
+for 的对象和 if 的条件是 context 中用 . 分隔的名称，if 的条件前可以加 not，不计算任意表达式
+块中的标签在复制出的元素中用 context(包括循环变量、loop)替换，context 中没有的标签保持原样，之后还可以用 replace_data 替换
+块外的元素原地保留，不复制
+"""
+import re
+import copy
+import collections
+from collections.abc import Mapping
+
+from lxml import etree
+from pptx.oxml.ns import qn
+from pptx.oxml.xmlchemy import OxmlElement
+
+import table_xml
+import xml_engine
+
+
+TAG_SP_TREE = qn("p:spTree")
+TAG_GRP_SP = qn("p:grpSp")
+TAG_A_TX_BODY = qn("a:txBody")
+TAG_TBL = qn("a:tbl")
+TAG_TR = qn("a:tr")
+
+# 容器的种类：子元素是图形、段落还是表格行
+KIND_SHAPES = "shapes"
+KIND_PARAGRAPHS = "paragraphs"
+KIND_ROWS = "rows"
+
+CONTAINER_KINDS = {
+    TAG_SP_TREE: KIND_SHAPES,
+    TAG_GRP_SP: KIND_SHAPES,
+    xml_engine.TAG_TX_BODY: KIND_PARAGRAPHS,
+    TAG_A_TX_BODY: KIND_PARAGRAPHS,
+    TAG_TBL: KIND_ROWS,
+}
+
+BLOCK_FLAG = "{%"
+BLOCK_TEXT_XPATH = etree.XPath(".//a:t[contains(., '{%')]", namespaces=xml_engine.NAMESPACES)
+XFRM_XPATH = etree.XPath("p:spPr/a:xfrm | p:grpSpPr/a:xfrm | p:xfrm", namespaces=xml_engine.NAMESPACES)
+C_NV_PR_XPATH = etree.XPath(".//p:cNvPr", namespaces=xml_engine.NAMESPACES)
+
+BLOCK_TAG_PATTERN = re.compile(r"^\{%\s*(for|endfor|if|else|endif)\b\s*(.*?)\s*%\}$")
+FOR_ARGS_PATTERN = re.compile(r"^([A-Za-z_]\w*)\s+in\s+(\S+)$")
+IF_ARGS_PATTERN = re.compile(r"^(not\s+)?(\S+)$")
+
+# 空计划：幻灯片上没有块标记
+EMPTY_PLAN = ()
+
+# 含有块的容器：path 是从计划的根元素开始逐层的子元素序号，tag、child_count 用来检查计划是否还适用
+ContainerPlan = collections.namedtuple("ContainerPlan", ["path", "tag", "child_count", "kind", "nodes"])
+# 容器中的一个元素：块外的元素 index 是它在容器中的序号，原地保留；
+# 块中的元素 index 为 None，每次渲染复制 prototype；label_texts 是其中含有标签的 a:t：((a:t 的序号, 文本片段), ...)
+# 文本片段见 compile_label_text；inner_plans 是元素内部含有块的容器(比如块外的文本框中的段落块)，路径相对于元素
+ElementNode = collections.namedtuple("ElementNode", ["index", "prototype", "label_texts", "inner_plans"])
+# expr 是按 . 拆开的名称；offset：图形块每次循环向下移动的距离(EMU)，其它块为 0
+ForNode = collections.namedtuple("ForNode", ["var", "expr", "body", "offset"])
+IfNode = collections.namedtuple("IfNode", ["negate", "expr", "body", "else_body"])
+# 块标记有错误(没有闭合、多出的 endfor、参数不对)的幻灯片：编译时只记下错误，执行计划时才报错，
+# 没有使用块的模板即使有 {% 开头的普通文本也不受影响
+InvalidPlan = collections.namedtuple("InvalidPlan", ["error"])
+
+# context 中找不到名称
+MISSING = object()
+
+
+def get_element_text(element, kind):
+    """
+    判断块标记用的文本：段落的文本；表格行、文本框中只有一个非空段落时是这个段落的文本
+    有多个段落的表格行、文本框不是块标记，其中的段落可以是段落块的标记
+    """
+    if kind == KIND_PARAGRAPHS:
+        if element.tag != xml_engine.TAG_P:
+            return ""
+        return "".join(xml_engine.RUN_TEXT_XPATH(element))
+    if kind == KIND_ROWS and element.tag == TAG_TR:
+        paragraphs = element.iter(xml_engine.TAG_P)
+    elif kind == KIND_SHAPES and element.tag == xml_engine.TAG_SP:
+        paragraphs = xml_engine.SELF_PARAGRAPH_XPATH(element)
+    else:
+        return ""
+    texts = [text for text in ("".join(xml_engine.RUN_TEXT_XPATH(p)).strip() for p in paragraphs) if text]
+    return texts[0] if len(texts) == 1 else ""
+
+
+def is_block_tag(text):
+    """
+    text 是否是块标记；不带空格的块标记(比如 {%endfor%}、{%else%})也符合默认的标签格式 {%s}，不能当作标签
+    """
+    return BLOCK_TAG_PATTERN.match(text.strip()) is not None
+
+
+def parse_block_tag(text):
+    """
+    :return: (块标记名称, 参数)，不是块标记(比如 "{%} growth"、"{%rate}")时返回 None
+    """
+    text = text.strip()
+    if not text.startswith(BLOCK_FLAG):
+        return None
+    match = BLOCK_TAG_PATTERN.match(text)
+    if match is None:
+        return None
+    name, args = match.groups()
+    if name == "for":
+        args_match = FOR_ARGS_PATTERN.match(args)
+        if args_match is None:
+            raise ValueError("invalid block tag: %s" % text)
+        return name, (args_match.group(1), tuple(args_match.group(2).split(".")))
+    if name == "if":
+        args_match = IF_ARGS_PATTERN.match(args)
+        if args_match is None:
+            raise ValueError("invalid block tag: %s" % text)
+        return name, (bool(args_match.group(1)), tuple(args_match.group(2).split(".")))
+    if args:
+        raise ValueError("invalid block tag: %s" % text)
+    return name, None
+
+
+def get_block_offset(elements):
+    """
+    图形块的高度：块中所有图形的外接矩形的高度
+    """
+    tops, bottoms = [], []
+    for element in elements:
+        for xfrm in XFRM_XPATH(element):
+            if xfrm.off is not None and xfrm.ext is not None:
+                tops.append(xfrm.off.y)
+                bottoms.append(xfrm.off.y + xfrm.ext.cy)
+    if not tops:
+        return 0
+    return max(bottoms) - min(tops)
+
+
+def compile_label_text(pptx_obj, text):
+    """
+    把含有标签的文本拆成片段，渲染时不再用正则表达式扫描
+    :return: (片段, ...)，片段是原样保留的字符串，或者 (标签, 按 . 拆开的名称)
+    """
+    left = pptx_obj.get_replace_label_left_part()
+    right = pptx_obj.get_replace_label_right_part()
+    segments = []
+    end = 0
+    for match in pptx_obj.replace_label_format_pattern.finditer(text):
+        if match.start() > end:
+            segments.append(text[end:match.start()])
+        label = match.group(0)
+        segments.append((label, tuple(label[len(left):len(label) - len(right)].split("."))))
+        end = match.end()
+    if end < len(text):
+        segments.append(text[end:])
+    return tuple(segments)
+
+
+def make_fragment(pptx_obj, element):
+    """
+    块中的元素编译成可以反复复制的原型：合并被拆分的标签，拆分含有标签的 a:t 的文本，编译内部的块
+    """
+    prototype = copy.deepcopy(element)
+    left_flag = pptx_obj.get_replace_label_left_part()
+    for p in prototype.iter(xml_engine.TAG_P):
+        if left_flag in xml_engine.get_paragraph_text(p):
+            pptx_obj.normalize_split_labels(p)
+    label_texts = tuple((i, compile_label_text(pptx_obj, t.text))
+                        for i, t in enumerate(prototype.iter(xml_engine.TAG_T))
+                        if t.text and pptx_obj.is_contain_replace_label(t.text))
+    return ElementNode(None, prototype, label_texts, compile_plans(pptx_obj, prototype))
+
+
+def compile_container(pptx_obj, container, kind):
+    """
+    把容器的子元素按块标记编译成节点树
+    :return: [节点]，容器中没有块标记时返回 None
+    """
+    children = list(container)
+    tags = [parse_block_tag(get_element_text(child, kind)) for child in children]
+    if not any(tags):
+        return None
+
+    # 栈中每一层：[块标记, 块开始的子元素序号, body, else_body]，第0层是容器本身
+    stack = [[None, None, [], None]]
+    for i, (child, tag) in enumerate(zip(children, tags)):
+        frame = stack[-1]
+        body = frame[3] if frame[3] is not None else frame[2]
+        if tag is None:
+            if len(stack) > 1:
+                body.append(make_fragment(pptx_obj, child))
+            else:
+                body.append(ElementNode(i, None, (), compile_plans(pptx_obj, child)))
+            continue
+
+        name, args = tag
+        if name in ("for", "if"):
+            stack.append([tag, i, [], None])
+        elif name == "else":
+            if frame[0] is None or frame[0][0] != "if" or frame[3] is not None:
+                raise ValueError("unexpected {% else %}")
+            frame[3] = []
+        else:
+            if frame[0] is None or frame[0][0] != name[3:]:
+                raise ValueError("unexpected {%% %s %%}" % name)
+            stack.pop()
+            block_tag, start, block_body, else_body = frame
+            if name == "endfor":
+                offset = 0
+                if kind == KIND_SHAPES:
+                    offset = get_block_offset([element for element, element_tag in
+                                               zip(children[start + 1:i], tags[start + 1:i]) if element_tag is None])
+                node = ForNode(block_tag[1][0], block_tag[1][1], tuple(block_body), offset)
+            else:
+                node = IfNode(block_tag[1][0], block_tag[1][1], tuple(block_body), tuple(else_body or ()))
+            parent = stack[-1]
+            (parent[3] if parent[3] is not None else parent[2]).append(node)
+
+    if len(stack) > 1:
+        raise ValueError("{%% %s %%} is not closed" % stack[-1][0][0])
+    return tuple(stack[0][2])
+
+
+def compile_slide_plan(pptx_obj, sp_tree):
+    """
+    编译幻灯片的计划，块标记有错误时不抛出异常
+    :return: compile_plans 的结果，或者 InvalidPlan
+    """
+    try:
+        return compile_plans(pptx_obj, sp_tree)
+    except ValueError as e:
+        return InvalidPlan(str(e))
+
+
+def compile_plans(pptx_obj, root):
+    """
+    编译 root(包括 root 本身)中所有含有块标记的容器
+    :param pptx_obj: PPTXTemplate，提供标签格式
+    :param root: 幻灯片的 spTree，或者块中的元素
+    :return: (ContainerPlan, ...)，没有块标记时返回 EMPTY_PLAN
+    """
+    if not BLOCK_TEXT_XPATH(root):
+        return EMPTY_PLAN
+    plans = []
+    _compile_element(pptx_obj, root, (), plans)
+    return tuple(plans)
+
+
+def _compile_element(pptx_obj, element, path, plans):
+    kind = CONTAINER_KINDS.get(element.tag)
+    if kind is not None:
+        nodes = compile_container(pptx_obj, element, kind)
+        if nodes is not None:
+            plans.append(ContainerPlan(path, element.tag, len(element), kind, nodes))
+            return
+    for i, child in enumerate(element):
+        if len(child):
+            _compile_element(pptx_obj, child, path + (i,), plans)
+
+
+def _resolve(root, path):
+    element = root
+    for i in path:
+        if i >= len(element):
+            return None
+        element = element[i]
+    return element
+
+
+def is_valid(root, plans):
+    """
+    计划是否还适用于 root：编译之后 root 的结构可能被修改过(比如删除了图形)，这时需要重新编译
+    """
+    if isinstance(plans, InvalidPlan):
+        # 幻灯片可能已经被修改正确，重新编译
+        return False
+    for plan in plans:
+        container = _resolve(root, plan.path)
+        if container is None or container.tag != plan.tag or len(container) != plan.child_count:
+            return False
+        for node in plan.nodes:
+            if isinstance(node, ElementNode) and not is_valid(container[node.index], node.inner_plans):
+                return False
+    return True
+
+
+def lookup(context, names):
+    """
+    按名称在 context 中逐层取值，依次尝试 字典的键、序列的下标、对象的属性
+    :param names: 按 . 拆开的名称，比如 ("student", "name")
+    :return: 找不到时返回 MISSING
+    """
+    try:
+        value = context[names[0]]
+    except KeyError:
+        return MISSING
+    for name in names[1:]:
+        if type(value) is dict or isinstance(value, Mapping):
+            value = value.get(name, MISSING)
+        elif name.isdigit() and isinstance(value, (list, tuple)):
+            value = value[int(name)] if int(name) < len(value) else MISSING
+        else:
+            value = getattr(value, name, MISSING)
+        if value is MISSING:
+            return MISSING
+    return value
+
+
+def render_text(segments, context):
+    """
+    用 context 拼出 compile_label_text 拆分的文本，context 中没有的标签保持原样
+    """
+    texts = []
+    for segment in segments:
+        if type(segment) is str:
+            texts.append(segment)
+            continue
+        value = lookup(context, segment[1])
+        texts.append(segment[0] if value is MISSING else str(value))
+    return "".join(texts)
+
+
+def shift_element(element, offset):
+    for xfrm in XFRM_XPATH(element):
+        if xfrm.off is not None:
+            xfrm.off.y = xfrm.off.y + offset
+
+
+def render_nodes(nodes, children, context, out):
+    """
+    执行节点，渲染出的元素按顺序放入 out
+    :param children: 容器原来的子元素，块外的元素原地保留
+    """
+    for node in nodes:
+        if isinstance(node, ElementNode):
+            if node.index is not None:
+                element = children[node.index]
+            else:
+                element = copy.deepcopy(node.prototype)
+                if node.label_texts:
+                    texts = list(element.iter(xml_engine.TAG_T))
+                    for i, segments in node.label_texts:
+                        texts[i].text = render_text(segments, context)
+            execute_plans(element, node.inner_plans, context)
+            out.append(element)
+        elif isinstance(node, ForNode):
+            items = lookup(context, node.expr)
+            items = [] if items is MISSING or items is None else list(items)
+            for i, item in enumerate(items):
+                start = len(out)
+                loop = {"index": i + 1, "index0": i, "first": i == 0, "last": i == len(items) - 1,
+                        "length": len(items)}
+                render_nodes(node.body, children, collections.ChainMap({node.var: item, "loop": loop}, context), out)
+                if node.offset and i:
+                    for element in out[start:]:
+                        shift_element(element, node.offset * i)
+        else:
+            value = lookup(context, node.expr)
+            value = value is not MISSING and bool(value)
+            if value != node.negate:
+                render_nodes(node.body, children, context, out)
+            else:
+                render_nodes(node.else_body, children, context, out)
+
+
+def execute_container(container, plan, context):
+    children = list(container)
+    out = []
+    render_nodes(plan.nodes, children, context, out)
+    for child in children:
+        container.remove(child)
+    container.extend(out)
+
+    if plan.kind == KIND_PARAGRAPHS and container.find(xml_engine.TAG_P) is None:
+        # 文本框中至少要有一个段落
+        container.append(OxmlElement("a:p"))
+    elif plan.kind == KIND_ROWS:
+        graphic_frame = container.getparent().getparent().getparent()
+        if graphic_frame is not None:
+            table_xml.update_frame_height(graphic_frame, container)
+
+
+def execute_plans(root, plans, context):
+    """
+    执行计划，展开 root 中的块
+    :param root: 编译计划时的根元素(或者它的副本)
+    :param plans: compile_plans 的结果
+    :param context: 块和标签使用的数据，比如 {"students": [{"name": "zzz"}], "show_note": True}
+    :return:
+    """
+    for plan in plans:
+        execute_container(_resolve(root, plan.path), plan, context)
+
+
+def renumber_shape_ids(sp_tree):
+    """
+    图形块复制出的图形与原图形的 id 相同，重复的 id 改为新的 id
+    """
+    c_nv_prs = C_NV_PR_XPATH(sp_tree)
+    ids = [int(c_nv_pr.get("id", 0)) for c_nv_pr in c_nv_prs]
+    next_id = max(ids or [0]) + 1
+    used = set()
+    for c_nv_pr, shape_id in zip(c_nv_prs, ids):
+        if shape_id in used:
+            c_nv_pr.set("id", str(next_id))
+            next_id += 1
+        else:
+            used.add(shape_id)
+
+
+def get_plan_labels(plans):
+    """
+    块中的元素含有的标签，这些标签由 render_blocks 用 context 替换，inventory 用来区分块中的标签
+    :return: set(标签)
+    """
+    labels = set()
+    if isinstance(plans, InvalidPlan):
+        return labels
+    for plan in plans:
+        _collect_node_labels(plan.nodes, labels)
+    return labels
+
+
+def _collect_node_labels(nodes, labels):
+    for node in nodes:
+        if isinstance(node, ElementNode):
+            for _, segments in node.label_texts:
+                labels.update(segment[0] for segment in segments if type(segment) is not str)
+            for plan in node.inner_plans:
+                _collect_node_labels(plan.nodes, labels)
+        elif isinstance(node, ForNode):
+            _collect_node_labels(node.body, labels)
+        else:
+            _collect_node_labels(node.body, labels)
+            _collect_node_labels(node.else_body, labels)
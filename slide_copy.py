@@ -4,11 +4,15 @@
 #!/usr/bin/env python
 #-*- coding:utf-8 -*-
 
-from typing import Union
+from typing import TYPE_CHECKING, Union
 
-import pandas as pd
+if TYPE_CHECKING:
+    import pandas as pd
+
+# pandas, numpy and openpyxl are imported inside the helpers that need them,
+# so that importing this module (and pptxtpl) stays cheap.
 
-def chart_to_dataframe(graphical_frame) -> pd.DataFrame:
+def chart_to_dataframe(graphical_frame) -> "pd.DataFrame":
     """
     Helper to parse chart data to a DataFrame.
 
@@ -68,111 +72,38 @@ def dataframe_to_chart_data(df):
     return copy_data
 
 
-def clone_chart(graphical_frame, dest):
+def clone_chart(graphical_frame, dest, allocator=None):
     """
     Helper to clone a chart with related styling.
 
+    The chart part, its embedded workbook and its style/colors parts are
+    duplicated byte for byte under fresh partnames, no spreadsheet parsing
+    is involved.
+
     :param graphical_frame:
     :param dest:
+    :param allocator: pptx_package.PartnameAllocator shared by successive copies,
+                      a new one (a full package walk) is created when omitted
     :return:
     """
-    chart = graphical_frame.chart
-
-    df = chart_to_dataframe(graphical_frame)
-    chart_data = dataframe_to_chart_data(df)
-
-    new_chart = dest.shapes.add_chart(
-        chart.chart_type,
-        graphical_frame.left,
-        graphical_frame.top,
-        graphical_frame.width,
-        graphical_frame.height,
-        chart_data
-    )
-
-    # Fix offset for Graphical shape
     import copy
-    cur_el = new_chart._element.xpath(".//p:nvGraphicFramePr")[0]
-    ref_el = graphical_frame._element.xpath(".//p:nvGraphicFramePr")[0]
-    parent = cur_el.getparent()
-    parent.insert(
-        parent.index(cur_el) + 1,
-        copy.deepcopy(ref_el)
-    )
-    parent.remove(cur_el)
-
-    # Clone styling from old chart to new one
-    from random import randrange
-    from lxml import etree
-    from pptx.oxml import parse_xml
-
-    id_attribute = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}id'
-
-    old_chart_ref_id = graphical_frame.element.xpath(".//c:chart")[0].attrib[id_attribute]
-    chart_ref_id = new_chart.element.xpath(".//c:chart")[0].attrib[id_attribute]
-
-    new_chart_part = new_chart.part.rels._rels[chart_ref_id].target_part
-    old_chart_part = graphical_frame.part.rels._rels[old_chart_ref_id].target_part
-
-    chart_data_reference_id = new_chart_part._element.xpath(".//c:externalData")[0].attrib[id_attribute]
-
-    cloned_styling = copy.deepcopy(old_chart_part._element)
-    cloned_styling.xpath(".//c:externalData")[0].set(id_attribute, chart_data_reference_id)
-    cloned_styling.xpath(".//c:autoUpdate")[0].set("val", "1")
-    new_chart_part.part._element = cloned_styling
-
-    # Parse other relationships of the chart
-    from pptx.opc.constants import CONTENT_TYPE as CT, RELATIONSHIP_TYPE as RT
-    from pptx.opc.package import XmlPart
-
-    class ColorsPart(XmlPart):
-        partname_template = "/ppt/charts/colors%d.xml"
-
-        @classmethod
-        def new(cls, package, element):
-            part = cls.load(
-                package.next_partname(cls.partname_template),
-                CT.OFC_CHART_COLORS,
-                package,
-                element,
-            )
-            return part
-
-    class StylePart(XmlPart):
-        partname_template = "/ppt/charts/style%d.xml"
-
-        @classmethod
-        def new(cls, package, element):
-            part = cls.load(
-                package.next_partname(cls.partname_template),
-                CT.OFC_CHART_STYLE,
-                package,
-                element,
-            )
-            return part
+    from pptx.opc.constants import RELATIONSHIP_TYPE as RT
+    from pptx.oxml.ns import qn
 
-    new_chart_refs = new_chart_part.rels
-    old_chart_refs = old_chart_part.rels
+    import pptx_package
 
-    # Fix styling and colors applied to the new chart
-    for k, v in dict(old_chart_refs._rels).items():
-        if v.reltype == 'http://schemas.microsoft.com/office/2011/relationships/chartStyle':
-            targ = v.target_part
+    chart_part = graphical_frame.chart_part
+    if allocator is None:
+        allocator = pptx_package.get_partname_allocator(dest.part.package)
 
-            new_el = parse_xml(copy.deepcopy(targ.blob))
-            new_el.set("id", str(randrange(10 ** 5, 10 ** 9)))
-            new_colors_ref = StylePart.new(targ.package, etree.tostring(new_el))
-            new_chart_refs.get_or_add("http://schemas.microsoft.com/office/2011/relationships/chartStyle",
-                                      new_colors_ref)
-        elif v.reltype == RT.CHART_COLOR_STYLE:
-            targ = v.target_part
+    new_chart_part = pptx_package.duplicate_part(chart_part, allocator)
+    rId = allocator.relate_to(dest.part, new_chart_part, RT.CHART)
 
-            new_el = parse_xml(copy.deepcopy(targ.blob))
-            new_el.set("id", str(randrange(10 ** 5, 10 ** 9)))
-            new_colors_ref = ColorsPart.new(targ.package, etree.tostring(new_el))
-            new_chart_refs.get_or_add(RT.CHART_COLOR_STYLE, new_colors_ref)
+    new_el = copy.deepcopy(graphical_frame._element)
+    new_el.xpath(".//c:chart")[0].set(qn("r:id"), rId)
+    dest.shapes._spTree.insert_element_before(new_el, "p:extLst")
 
-    return new_chart
+    return dest.shapes[-1]
 
 
 def _object_rels(obj):
@@ -186,67 +117,93 @@ def _object_rels(obj):
         return [k for k in rels]
 
 
-def _exp_add_slide(ppt, slide_layout):
+def _exp_add_slide(ppt, slide_layout, allocator=None):
     """
     Function to handle slide creation in the Presentation, to avoid issues caused by default implementation.
 
+    The slide partname, the presentation rId and the slide id all come from
+    the allocator, so adding N slides no longer scans every relationship N times.
+
     :param slide_layout:
+    :param allocator: pptx_package.PartnameAllocator
     :return:
     """
+    from pptx.opc.constants import RELATIONSHIP_TYPE as RT
+    from pptx.parts.slide import SlidePart
 
-    def generate_slide_partname(self):
-        """Return |PackURI| instance containing next available slide partname."""
-        from pptx.opc.packuri import PackURI
-
-        sldIdLst = self._element.get_or_add_sldIdLst()
-
-        existing_rels = [k.target_partname for k in _object_rels(self)]
-        partname_str = "/ppt/slides/slide%d.xml" % (len(sldIdLst) + 1)
-
-        while partname_str in existing_rels:
-            import random
-            import string
-
-            random_part = ''.join(random.choice(string.ascii_letters) for i in range(2))
-            partname_str = "/ppt/slides/slide%s%d.xml" % (random_part, len(sldIdLst) + 1)
-
-        return PackURI(partname_str)
+    import pptx_package
 
-    def add_slide_part(self, slide_layout):
-        """
-        Return an (rId, slide) pair of a newly created blank slide that
-        inherits appearance from *slide_layout*.
-        """
-        from pptx.opc.constants import RELATIONSHIP_TYPE as RT
-        from pptx.parts.slide import SlidePart
+    if allocator is None:
+        allocator = pptx_package.get_partname_allocator(ppt.part.package)
 
-        partname = generate_slide_partname(self)
-        slide_layout_part = slide_layout.part
-        slide_part = SlidePart.new(partname, self.package, slide_layout_part)
-        rId = self.relate_to(slide_part, RT.SLIDE)
-        return rId, slide_part.slide
+    slides = ppt.slides
+    partname = allocator.next_partname("/ppt/slides/slide%d.xml")
+    slide_part = SlidePart.new(partname, ppt.part.package, slide_layout.part)
+    rId = allocator.relate_to(ppt.part, slide_part, RT.SLIDE)
+    slide = slide_part.slide
+    slide.shapes.clone_layout_placeholders(slide_layout)
+    allocator.add_slide_id(slides._sldIdLst, rId)
+    return slide
 
-    def add_slide_ppt(self, slide_layout):
-        rId, slide = add_slide_part(self.part, slide_layout)
-        slide.shapes.clone_layout_placeholders(slide_layout)
-        self._sldIdLst.add_sldId(rId)
-        return slide
 
-    # slide_layout = self.get_master_slide_layout(slide_layout)
-    return add_slide_ppt(ppt.slides, slide_layout)
-
-
-def copy_shapes(source, dest):
+def copy_element_rels(element, source_part, dest_part, rId_map=None, allocator=None):
+    """
+    Relate ``dest_part`` to every part ``element`` references through an
+    ``r:`` attribute (r:embed, r:link, r:id) of ``source_part`` and rewrite
+    the attributes to the new rIds.
+
+    The targets are shared, not copied: a copied picture points at the very
+    same image part instead of re-adding (and re-hashing) the image bytes.
+
+    :param element: deep copy of an element from the source slide
+    :param source_part:
+    :param dest_part:
+    :param rId_map: {source rId: dest rId} shared by all elements copied to
+                    ``dest_part``, so a target referenced twice is related once
+    :param allocator: pptx_package.PartnameAllocator, new internal
+                      relationships skip the lookup of an existing one
+    :return:
+    """
+    import xml_engine
+
+    if rId_map is None:
+        rId_map = {}
+    source_rels = source_part.rels
+    for el, key, rId in list(xml_engine.iter_rel_references(element)):
+        new_rId = rId_map.get(rId)
+        if new_rId is None:
+            if rId not in source_rels:
+                continue
+            rel = source_rels[rId]
+            if rel.is_external:
+                new_rId = dest_part.relate_to(rel.target_ref, rel.reltype, is_external=True)
+            elif allocator is not None:
+                new_rId = allocator.relate_to(dest_part, rel.target_part, rel.reltype)
+            else:
+                new_rId = dest_part.relate_to(rel.target_part, rel.reltype)
+            rId_map[rId] = new_rId
+        el.set(key, new_rId)
+
+
+def copy_shapes(source, dest, allocator=None, rId_map=None):
     """
     Helper to copy shapes handling edge cases.
 
     :param source:
     :param dest:
+    :param allocator: pptx_package.PartnameAllocator for the copied charts
+    :param rId_map: see copy_element_rels, one per destination slide
     :return:
     """
     from pptx.shapes.group import GroupShape
+    from pptx.shapes.picture import Picture
     import copy
 
+    import xml_engine
+
+    if rId_map is None:
+        rId_map = {}
+
     # Copy all existing shapes
     for shape in source:
         if isinstance(shape, GroupShape):
@@ -259,7 +216,7 @@ def copy_shapes(source, dest):
             group.rotation = shape.rotation
 
             # Recursive copy of contents
-            copy_shapes(shape.shapes, group)
+            copy_shapes(shape.shapes, group, allocator, rId_map)
 
             # Fix offset
             cur_el = group._element.xpath(".//p:grpSpPr")[0]
@@ -270,50 +227,44 @@ def copy_shapes(source, dest):
                 copy.deepcopy(ref_el)
             )
             parent.remove(cur_el)
-
-            result = group
-        elif hasattr(shape, "image"):
-            import io
-
-            # Get image contents
-            content = io.BytesIO(shape.image.blob)
-            result = dest.shapes.add_picture(
-                content, shape.left, shape.top, shape.width, shape.height
-            )
-            result.name = shape.name
-            result.crop_left = shape.crop_left
-            result.crop_right = shape.crop_right
-            result.crop_top = shape.crop_top
-            result.crop_bottom = shape.crop_bottom
+        elif isinstance(shape, Picture):
+            # Share the image part, cropping and name come along with the element
+            newel = copy.deepcopy(shape.element)
+            copy_element_rels(newel, shape.part, dest.part, rId_map, allocator)
+            xml_engine.insert_shape_element(dest.shapes._spTree, newel)
         elif hasattr(shape, "has_chart") and shape.has_chart:
-            result = clone_chart(shape, dest)
+            clone_chart(shape, dest, allocator)
         else:
-            import copy
-
             newel = copy.deepcopy(shape.element)
-            dest.shapes._spTree.insert_element_before(newel, "p:extLst")
-            result = dest.shapes[-1]
+            xml_engine.insert_shape_element(dest.shapes._spTree, newel)
 
 
-def duplicate_slide(ppt, slide_index: int):
+def duplicate_slide(ppt, slide_index: int, allocator=None):
     """
     Duplicate the slide with the given number in presentation.
     Adds the new slide by default at the end of the presentation.
 
     :param ppt:
     :param slide_index: Slide number
+    :param allocator: pptx_package.PartnameAllocator, pass the same one when
+                      duplicating many slides
     :return:
     """
+    import pptx_package
+
+    if allocator is None:
+        allocator = pptx_package.get_partname_allocator(ppt.part.package)
+
     source = ppt.slides[slide_index]
 
-    dest = _exp_add_slide(ppt, source.slide_layout)
+    dest = _exp_add_slide(ppt, source.slide_layout, allocator)
 
     # Remove all shapes from the default layout
     for shape in dest.shapes:
         remove_shape(shape)
 
     # Copy all existing shapes
-    copy_shapes(source.shapes, dest)
+    copy_shapes(source.shapes, dest, allocator)
 
     # Copy all existing shapes
     if source.has_notes_slide:
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+"""
+直接改写表格 xml(a:tbl)：以模板中的一行 a:tr 为原型复制出任意多行
+
+原型行的每个单元格只保留一个段落、一个 run，复制出的行直接写 a:t 的文本，
+不为每个单元格创建 python-pptx 的 _Cell/TextFrame 对象，也不清空、重建 run
+"""
+import copy
+
+from lxml import etree
+from pptx.oxml.ns import qn
+from pptx.oxml.xmlchemy import OxmlElement
+
+import xml_engine
+
+
+TAG_TC = qn("a:tc")
+TAG_P_PR = qn("a:pPr")
+TAG_END_PARA_RPR = qn("a:endParaRPr")
+TAG_RPR = qn("a:rPr")
+
+
+def _prepare_paragraph(p):
+    """
+    段落只保留第一个 run，文本清空；没有 run 时按段落结束符的格式新建一个
+    :return: a:r
+    """
+    r = p.find(xml_engine.TAG_R)
+    for child in list(p):
+        if child is not r and child.tag != TAG_P_PR and child.tag != TAG_END_PARA_RPR:
+            p.remove(child)
+
+    if r is None:
+        r = OxmlElement("a:r")
+        end_para_rpr = p.find(TAG_END_PARA_RPR)
+        if end_para_rpr is not None:
+            rpr = copy.deepcopy(end_para_rpr)
+            rpr.tag = TAG_RPR
+            r.append(rpr)
+        etree.SubElement(r, xml_engine.TAG_T)
+        if end_para_rpr is not None:
+            end_para_rpr.addprevious(r)
+        else:
+            p.append(r)
+
+    r.find(xml_engine.TAG_T).text = ""
+    return r
+
+
+def _prepare_cell(tc):
+    """
+    单元格只保留第一个段落和其中第一个 run，文本清空，格式不变
+    :return: a:r
+    """
+    tx_body = tc.get_or_add_txBody()
+    paragraphs = tx_body.findall(xml_engine.TAG_P)
+    if not paragraphs:
+        paragraphs = [tx_body.add_p()]
+    for p in paragraphs[1:]:
+        tx_body.remove(p)
+    return _prepare_paragraph(paragraphs[0])
+
+
+def set_cell_text(tc, text):
+    """
+    改写已有单元格的文本，与原型行的单元格一样只保留一个段落、一个 run：
+    没有 run 的单元格按段落结束符的格式新建，有多个 run 的文本只写一次
+    :param tc: a:tc
+    :param text:
+    :return:
+    """
+    _prepare_cell(tc).find(xml_engine.TAG_T).text = text
+
+
+def make_row_prototype(tr):
+    """
+    复制一行作为原型：每个单元格只保留第一个段落和其中第一个 run，文本清空，格式不变
+    :param tr: 模板中的 a:tr，不会被修改
+    :return: (原型 a:tr, [每个单元格的 a:r])
+    """
+    prototype = copy.deepcopy(tr)
+    runs = [_prepare_cell(tc) for tc in prototype.iterchildren(TAG_TC)]
+    return prototype, runs
+
+
+def append_rows(tbl, prototype, rows):
+    """
+    复制原型行，在表格末尾追加 rows 中的每一行
+    每个单元格在原型中只有一个 a:t，按顺序直接写入文本；行中缺少的单元格留空，多出的忽略
+    :param tbl: a:tbl
+    :param prototype: make_row_prototype 的原型行
+    :param rows: 文本的二维列表，非字符串会用 str() 转换
+    :return:
+    """
+    for row in rows:
+        tr = copy.deepcopy(prototype)
+        for t, text in zip(tr.iter(xml_engine.TAG_T), row):
+            t.text = text if isinstance(text, str) else str(text)
+        tbl.append(tr)
+
+
+def update_frame_height(graphic_frame, tbl):
+    """
+    表格行数变化后，把 graphicFrame 的高度更新为所有行高之和
+    :param graphic_frame: 表格所在的 p:graphicFrame
+    :param tbl: a:tbl
+    :return:
+    """
+    height = sum(int(tr.get("h", 0)) for tr in tbl.tr_lst)
+    ext = graphic_frame.find("%s/%s" % (qn("p:xfrm"), qn("a:ext")))
+    if ext is not None and height:
+        ext.set("cy", str(height))
@@ -0,0 +1,26 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+import io
+import os
+import sys
+import zipfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# 模块都在仓库根目录下，按 import pptxtpl 的方式导入
+sys.path.insert(0, ROOT)
+
+EXAMPLE_PPTX = os.path.join(ROOT, "example.pptx")
+
+
+@pytest.fixture
+def example_path():
+    return EXAMPLE_PPTX
+
+
+def open_saved(pptx_obj):
+    """
+    保存到内存，返回 zipfile.ZipFile
+    """
+    return zipfile.ZipFile(io.BytesIO(pptx_obj.save()))
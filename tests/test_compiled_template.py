@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+import io
+
+import pytest
+from pptx import Presentation
+from pptx.opc.constants import RELATIONSHIP_TYPE as RT
+
+import pptxtpl
+from conftest import open_saved
+
+CHART_DATA = {"category": ["A", "B"], "data": {"s": [1, 2]}}
+
+
+@pytest.fixture
+def compiled_template(example_path):
+    return pptxtpl.CompiledTemplate(example_path)
+
+
+def get_text(slide):
+    return "".join(slide.shapes._spTree.itertext())
+
+
+def get_series_values(slide):
+    chart = [shape for shape in slide.shapes if shape.has_chart][0].chart
+    return [list(series.values) for series in chart.plots[0].series]
+
+
+def test_instances_are_independent(compiled_template):
+    first = compiled_template.new_template()
+    first.replace_data(0, {"{name0}": "zzz"})
+    first.replace_bar_chart_data(1, {"{grade_title}": CHART_DATA}, {"{grade_title}": "grade"})
+    first.delete_slide(0)
+    second = compiled_template.new_template()
+    second.replace_data(0, {"{name0}": "wb"})
+
+    first_saved = Presentation(io.BytesIO(first.save()))
+    second_saved = Presentation(io.BytesIO(second.save()))
+    assert len(first_saved.slides) == 1
+    assert get_series_values(first_saved.slides[0]) == [[1.0, 2.0]]
+    assert "wb" in get_text(second_saved.slides[0]) and "zzz" not in get_text(second_saved.slides[0])
+    assert get_series_values(second_saved.slides[1]) != [[1.0, 2.0]]
+
+    # 模板不受渲染实例影响
+    third = compiled_template.new_template()
+    assert len(third.presentation.slides) == 2
+    assert "{name0}" in get_text(third.presentation.slides[0])
+    assert third.get_chart_title(third.presentation.slides[1].shapes[0].chart_part) == "{grade_title}"
+
+
+def test_instances_share_layouts(compiled_template):
+    first = compiled_template.new_template()
+    second = compiled_template.new_template()
+    assert first.presentation.slides[0].part is not second.presentation.slides[0].part
+    assert first.presentation.slide_layouts[0].part is second.presentation.slide_layouts[0].part
+
+
+def test_modify_shared_layout(compiled_template):
+    pptx_obj = compiled_template.new_template()
+    pptx_obj.presentation.slide_layouts[0].name = "changed"
+    with pytest.raises(ValueError, match="shared part"):
+        pptx_obj.save()
+
+
+def test_modify_shared_layout_rels(compiled_template):
+    pptx_obj = compiled_template.new_template()
+    pptx_obj.presentation.slide_layouts[0].part.relate_to("https://example.com", RT.HYPERLINK, is_external=True)
+    with pytest.raises(ValueError, match="shared part"):
+        pptx_obj.save()
+
+
+def test_make_parts_private(compiled_template):
+    pptx_obj = compiled_template.new_template()
+    layout_part = pptx_obj.presentation.slide_layouts[0].part
+    copies = pptx_obj.make_parts_private([layout_part])
+    # 版式和母版互相引用，母版连同它的所有版式一起复制
+    assert len(copies) == 12
+    copies[layout_part].slide_layout.name = "changed"
+    # 已经私有的 part 不再复制
+    assert pptx_obj.make_parts_private([copies[layout_part]]) == {}
+
+    zip_file = open_saved(pptx_obj)
+    names = zip_file.namelist()
+    assert len(names) == len(set(names))
+    saved = Presentation(io.BytesIO(pptx_obj.save()))
+    assert saved.slides[0].slide_layout.name == "changed"
+
+    other = compiled_template.new_template()
+    assert other.presentation.slide_layouts[0].name != "changed"
+    assert Presentation(io.BytesIO(other.save())).slides[0].slide_layout.name != "changed"
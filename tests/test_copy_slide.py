@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+import io
+import zipfile
+
+import pytest
+from pptx import Presentation
+from pptx.opc.constants import RELATIONSHIP_TYPE as RT
+
+import pptxtpl
+from conftest import open_saved
+
+CHART_SLIDE = 1
+COPY_METHODS = ["copy_slide", "pptx_copy_slide", "duplicate_slide_with_chart"]
+
+
+def get_chart(slide):
+    return [shape for shape in slide.shapes if shape.has_chart][0].chart
+
+
+def get_series_values(slide):
+    return [list(series.values) for series in get_chart(slide).plots[0].series]
+
+
+@pytest.fixture
+def pptx_obj(example_path):
+    pptx_obj = pptxtpl.PPTXTemplate(example_path)
+    # example.pptx 的统计图页没有备注页，先加上
+    pptx_obj.presentation.slides[CHART_SLIDE].notes_slide.notes_text_frame.text = "chart notes"
+    return pptx_obj
+
+
+@pytest.mark.parametrize("method", COPY_METHODS)
+def test_copy_chart_slide(pptx_obj, method):
+    source = pptx_obj.presentation.slides[CHART_SLIDE]
+    dest = getattr(pptx_obj, method)(CHART_SLIDE, CHART_SLIDE + 1)
+    assert pptx_obj.presentation.slides[CHART_SLIDE + 1] == dest
+
+    # 统计图及其内嵌 xlsx 是独立的 part
+    source_chart_part = get_chart(source).part
+    dest_chart_part = get_chart(dest).part
+    assert dest_chart_part is not source_chart_part
+    assert dest_chart_part.partname != source_chart_part.partname
+    source_xlsx_part = source_chart_part.chart_workbook.xlsx_part
+    dest_xlsx_part = dest_chart_part.chart_workbook.xlsx_part
+    assert dest_xlsx_part is not source_xlsx_part
+    assert dest_xlsx_part.partname != source_xlsx_part.partname
+
+    # 修改复制出的统计图不影响原统计图
+    source_values = get_series_values(source)
+    pptx_obj.replace_bar_chart_data_by_chart(get_chart(dest), {"category": ["A", "B"], "data": {"s": [1, 2]}})
+    assert get_series_values(source) == source_values
+    assert source_xlsx_part.blob != dest_xlsx_part.blob
+
+    # 备注页复制，并且指回新的幻灯片
+    assert dest.has_notes_slide
+    notes_part = dest.notes_slide.part
+    assert notes_part is not source.notes_slide.part
+    assert notes_part.part_related_by(RT.SLIDE) is dest.part
+    assert dest.notes_slide.notes_text_frame.text == "chart notes"
+
+    blob = pptx_obj.save()
+    names = zipfile.ZipFile(io.BytesIO(blob)).namelist()
+    assert len(names) == len(set(names))
+
+    saved = Presentation(io.BytesIO(blob))
+    assert get_series_values(saved.slides[CHART_SLIDE]) == source_values
+    assert get_series_values(saved.slides[CHART_SLIDE + 1]) == [[1.0, 2.0]]
+    assert saved.slides[CHART_SLIDE + 1].notes_slide.part.part_related_by(RT.SLIDE) is \
+        saved.slides[CHART_SLIDE + 1].part
+
+
+def test_copy_chart_slide_repeatedly(pptx_obj):
+    # 多次复制(包括复制出的幻灯片再复制)时 part 名称不重复
+    # 统计图页是最后一页，复制出的幻灯片放在最前面
+    for method in COPY_METHODS:
+        getattr(pptx_obj, method)(len(pptx_obj.presentation.slides) - 1, 0)
+    pptx_obj.copy_slide(0, 0)
+    pptx_obj.add_blank_slide()
+
+    names = open_saved(pptx_obj).namelist()
+    assert len(names) == len(set(names))
+    assert len([name for name in names if name.startswith("ppt/charts/chart")]) == 5
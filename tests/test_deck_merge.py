@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+import io
+
+import pytest
+from lxml import etree
+from pptx import Presentation
+from pptx.opc.constants import RELATIONSHIP_TYPE as RT
+
+import pptxtpl
+from conftest import open_saved
+
+MASTER = "ppt/slideMasters/slideMaster1.xml"
+MASTER_RELS = "ppt/slideMasters/_rels/slideMaster1.xml.rels"
+
+
+def make_source(example_path, layout_name="merged layout"):
+    """
+    example.pptx 改名一个版式(母版不变，版式与目标中的都不同)，再加一页使用这个版式的幻灯片
+    :return: pptx 的 bytes
+    """
+    pptx_obj = pptxtpl.PPTXTemplate(example_path)
+    layout = pptx_obj.presentation.slide_layouts[1]
+    layout.part._element.cSld.set("name", layout_name)
+    pptx_obj.presentation.slides.add_slide(layout)
+    return pptx_obj.save()
+
+
+def get_layout_counts(zip_file):
+    """
+    :return: (母版中 sldLayoutId 的个数, 母版 rels 中版式关系的个数, zip 中版式文件的个数)
+    """
+    master = etree.fromstring(zip_file.read(MASTER))
+    rels = etree.fromstring(zip_file.read(MASTER_RELS))
+    return (len(master.xpath("//p:sldLayoutId", namespaces={"p": master.nsmap["p"]})),
+            len([rel for rel in rels if rel.get("Type") == RT.SLIDE_LAYOUT]),
+            len([name for name in zip_file.namelist() if name.startswith("ppt/slideLayouts/slideLayout")]))
+
+
+def test_append_presentation(example_path):
+    pptx_obj = pptxtpl.PPTXTemplate(example_path)
+    assert pptx_obj.append_presentation(example_path) == 2
+    # 完全相同的演示文稿：版式、母版、图片都不再重复保存
+    assert pptx_obj.append_presentation(example_path) == 2
+    zip_file = open_saved(pptx_obj)
+    names = zip_file.namelist()
+    assert len(names) == len(set(names))
+    assert get_layout_counts(zip_file) == (11, 11, 11)
+    assert len([name for name in names if name.startswith("ppt/slideMasters/slideMaster")]) == 1
+    assert len([name for name in names if name.startswith("ppt/slides/slide")]) == 6
+    assert len([name for name in names if name.startswith("ppt/charts/chart")]) == 3
+
+
+def test_append_presentation_new_layout(example_path):
+    pptx_obj = pptxtpl.PPTXTemplate(example_path)
+    assert pptx_obj.append_presentation(make_source(example_path)) == 3
+    assert get_layout_counts(open_saved(pptx_obj)) == (12, 12, 12)
+
+    saved = Presentation(io.BytesIO(pptx_obj.save()))
+    assert saved.slides[-1].slide_layout.name == "merged layout"
+    assert saved.slides[-1].slide_layout.slide_master is saved.slide_masters[0]
+
+
+def test_append_presentation_to_compiled_instance(example_path):
+    # 渲染实例与模板、其它实例共享母版，把版式加到母版之前要先复制一份私有的母版
+    compiled_template = pptxtpl.CompiledTemplate(example_path)
+    pptx_obj = compiled_template.new_template()
+    pptx_obj.append_presentation(make_source(example_path))
+
+    zip_file = open_saved(pptx_obj)
+    names = zip_file.namelist()
+    assert len(names) == len(set(names))
+    assert get_layout_counts(zip_file) == (12, 12, 12)
+    saved = Presentation(io.BytesIO(pptx_obj.save()))
+    assert saved.slides[-1].slide_layout.name == "merged layout"
+    assert [len(master.slide_layouts) for master in saved.slide_masters] == [12]
+    # 原来的幻灯片使用私有母版下的版式
+    assert saved.slides[0].slide_layout.slide_master is saved.slide_masters[0]
+
+    # 模板和其它实例不受影响
+    for other in (compiled_template.pptx_template, compiled_template.new_template()):
+        assert len(other.presentation.slide_masters[0].slide_layouts) == 11
+        assert get_layout_counts(open_saved(other)) == (11, 11, 11)
+
+
+@pytest.mark.parametrize("incremental_save", [False, True])
+def test_merge_presentations(example_path, incremental_save):
+    compiled_template = pptxtpl.CompiledTemplate(example_path, incremental_save=incremental_save)
+    reports = []
+    for name in ("zzz", "wb"):
+        pptx_obj = compiled_template.new_template()
+        pptx_obj.replace_data(0, {"{name0}": name})
+        reports.append(pptx_obj.save())
+
+    saved = Presentation(io.BytesIO(pptxtpl.merge_presentations(reports)))
+    texts = ["".join(slide.shapes._spTree.itertext()) for slide in saved.slides]
+    assert len(texts) == 4
+    assert "zzz" in texts[0] and "wb" in texts[2]
+
+    with pytest.raises(ValueError):
+        pptxtpl.merge_presentations([])
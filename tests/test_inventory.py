@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+import pytest
+
+import inventory
+
+
+@pytest.fixture
+def example_inventory(example_path):
+    return inventory.build_inventory(example_path)
+
+
+def get_replace_data():
+    return {"{name0}": "zzz", "{age0}": 90, "{name1}": "wb", "{age1}": 45, "{name2}": "zb", "{age2}": 18,
+            "{student_number}": 3}
+
+
+def test_build_inventory(example_inventory):
+    slides = example_inventory["slides"]
+    assert len(slides) == 2
+    assert sorted(item["label"] for item in slides[0]["labels"]) == sorted(get_replace_data())
+    assert [chart["title"] for chart in slides[1]["charts"]] == ["{grade_title}"]
+
+
+def test_validate_record(example_inventory):
+    record = {"slides": [{"index": 0, "replace_data": get_replace_data(), "table_data": [[1, "zzz", 90]]},
+                         {"index": -1, "title_data": {"{grade_title}": {}}}]}
+    assert inventory.validate_record(example_inventory, record) == []
+
+
+def test_validate_record_errors(example_inventory):
+    data = get_replace_data()
+    del data["{age2}"]
+    record = {"slides": [{"index": 0, "replace_data": data},
+                         {"index": 1, "title_data": {"{other}": {}}},
+                         {"index": 2}]}
+    assert inventory.validate_record(example_inventory, record) == [
+        "slide 0: missing label {age2}",
+        "slide 1: no chart titled {other}",
+        "slide index out of range: 2",
+    ]
+    assert inventory.validate_record(example_inventory, {"slides": [{"index": 0, "replace_data": dict(
+        get_replace_data(), **{"{extra}": 1})}]}, strict=True) == ["slide 0: unknown label {extra}"]
+
+
+def test_validate_record_delete_shapes(example_inventory):
+    # delete_shapes 会删除没有数据的标签所在的图形
+    record = {"slides": [{"index": 0, "replace_data": {"{name0}": "zzz"}, "delete_shapes": True}]}
+    assert inventory.validate_record(example_inventory, record) == []
+
+
+@pytest.mark.parametrize("record, error", [
+    ("record", "record must be an object, got str"),
+    ({"slides": "x"}, "slides must be a list, got str"),
+    ({"slides": [1]}, "slides[0] must be an object, got int"),
+    ({"slides": [{"index": "0"}]}, "slide index out of range: '0'"),
+    ({"slides": [{"index": True}]}, "slide index out of range: True"),
+    ({"slides": [{"index": 0, "replace_data": ["{name0}"]}]}, "slide 0: replace_data must be an object"),
+    ({"slides": [{"index": 1, "title_data": "{grade_title}"}]}, "slide 1: title_data must be an object"),
+    ({"slides": [{"index": 0, "table_data": [1, 2]}]}, "slide 0: table_data must be a list of rows"),
+    ({"slides": [{"index": 0, "table_data": 1}]}, "slide 0: table_data must be a list of rows"),
+    ({"slides": [{"index": 0, "table_data": [[1, 2, 3, 4, 5, 6]]}]}, "slide 0: table has 4 columns, got 6"),
+    ({"slides": [{"index": 1, "table_data": [[1]]}]}, "slide 1: no table for table_data"),
+])
+def test_validate_malformed_record(example_inventory, record, error):
+    assert inventory.validate_record(example_inventory, record) == [error]
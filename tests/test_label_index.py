@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+import io
+
+import pytest
+from pptx.util import Inches
+
+import pptxtpl
+
+# 一个标签被拆分到三个run中，run的格式各不相同
+SPLIT_RUNS = [(u"学号：{stu", True), (u"dent_", False), (u"id} 号", False)]
+
+
+def make_template(example_path, runs=SPLIT_RUNS, name="split"):
+    """
+    example.pptx 第0页加一个文本框，一个段落由 runs 组成
+    :return: 模板的 bytes
+    """
+    pptx_obj = pptxtpl.PPTXTemplate(example_path)
+    shape = pptx_obj.presentation.slides[0].shapes.add_textbox(0, 0, Inches(4), Inches(1))
+    shape.name = name
+    paragraph = shape.text_frame.paragraphs[0]
+    for text, bold in runs:
+        run = paragraph.add_run()
+        run.text = text
+        run.font.bold = bold
+    return pptx_obj.save()
+
+
+def get_shape(pptx_obj, name, index=0):
+    for shape in pptx_obj.presentation.slides[index].shapes:
+        if shape.name == name:
+            return shape
+    raise KeyError(name)
+
+
+def count_builds(monkeypatch, pptx_obj):
+    """
+    记录 build_slide_label_index 的调用次数
+    :return: [调用次数]
+    """
+    counter = [0]
+    build = pptx_obj.build_slide_label_index
+
+    def counting_build(slide):
+        counter[0] += 1
+        return build(slide)
+
+    monkeypatch.setattr(pptx_obj, "build_slide_label_index", counting_build)
+    return counter
+
+
+def test_build_slide_label_index(example_path):
+    pptx_obj = pptxtpl.PPTXTemplate(example_path)
+    slides = pptx_obj.presentation.slides
+    slide_label_index = pptx_obj.build_slide_label_index(slides[0])
+    assert set(slide_label_index) == {"{name0}", "{age0}", "{name1}", "{age1}", "{name2}", "{age2}",
+                                      "{student_number}"}
+    assert pptx_obj.label_index[slides[0].part] is slide_label_index
+    # 索引中的位置指向标签所在的run
+    location = slide_label_index["{student_number}"][0]
+    assert isinstance(location, pptxtpl.LabelLocation)
+    assert pptx_obj.get_label_runs(slides[0], slide_label_index, {"{student_number}": 1})[0].text == \
+        "{student_number}"
+    assert pptx_obj.build_slide_label_index(slides[1]) == {}
+
+
+def test_split_labels(example_path):
+    pptx_obj = pptxtpl.PPTXTemplate(io.BytesIO(make_template(example_path)))
+    slide_label_index = pptx_obj.build_slide_label_index(pptx_obj.presentation.slides[0])
+    assert len(slide_label_index["{student_id}"]) == 1
+
+    # 合并后的标签使用第一个run的格式，标签后面的文本留在原来的run中，合并空了的run删除
+    runs = get_shape(pptx_obj, "split").text_frame.paragraphs[0].runs
+    assert [(run.text, run.font.bold) for run in runs] == [(u"学号：{student_id}", True), (u" 号", False)]
+    pptx_obj.replace_data(0, {"{student_id}": "zzz"})
+    assert get_shape(pptx_obj, "split").text_frame.text == u"学号：zzz 号"
+
+
+def test_split_labels_compiled_template(example_path):
+    # 编译模板时合并拆分的标签，渲染实例直接使用模板的索引
+    compiled_template = pptxtpl.CompiledTemplate(io.BytesIO(make_template(example_path)))
+    for name in ("zzz", "wb"):
+        pptx_obj = compiled_template.new_template()
+        slide_part = pptx_obj.presentation.slides[0].part
+        assert "{student_id}" in pptx_obj.label_index[slide_part]
+        pptx_obj.replace_data(0, {"{student_id}": name})
+        assert get_shape(pptx_obj, "split").text_frame.text == u"学号：%s 号" % name
+
+
+def test_index_is_reused(example_path, monkeypatch):
+    compiled_template = pptxtpl.CompiledTemplate(example_path)
+    pptx_obj = compiled_template.new_template()
+    counter = count_builds(monkeypatch, pptx_obj)
+    pptx_obj.replace_data(0, {"{name0}": "zzz", "{age0}": 90})
+    # data 中不在幻灯片上的标签不会引起重建索引
+    pptx_obj.replace_data(0, {"{name1}": "wb", "{missing}": "x"})
+    assert counter[0] == 0
+    texts = [shape.text_frame.text for shape in pptx_obj.get_slide_single_shapes(0) if shape.has_text_frame]
+    assert "{missing}" not in "".join(texts)
+    assert "zzz" in "".join(texts) and "wb" in "".join(texts)
+
+
+@pytest.mark.parametrize("runs", [[(u"新标签：{new_label}", False)],
+                                  [(u"新标签：{new_", False), (u"label}", True)]])
+def test_new_labels_rebuild_index(example_path, monkeypatch, runs):
+    # 建立索引之后写入的标签(包括被拆分到多个run中的)，替换时重新建立索引
+    pptx_obj = pptxtpl.PPTXTemplate(example_path)
+    pptx_obj.build_label_index()
+    counter = count_builds(monkeypatch, pptx_obj)
+    shape = pptx_obj.presentation.slides[0].shapes.add_textbox(0, 0, Inches(4), Inches(1))
+    paragraph = shape.text_frame.paragraphs[0]
+    for text, bold in runs:
+        run = paragraph.add_run()
+        run.text = text
+        run.font.bold = bold
+
+    pptx_obj.replace_data(0, {pptx_obj.add_ppt_label("new_label"): "zzz"})
+    assert counter[0] == 1
+    assert paragraph.text == u"新标签：zzz"
+
+
+def test_changed_labels_rebuild_index(example_path, monkeypatch):
+    pptx_obj = pptxtpl.PPTXTemplate(example_path)
+    pptx_obj.build_label_index()
+    counter = count_builds(monkeypatch, pptx_obj)
+    # 标签所在的run被改写，索引失效：重建后找不到标签，不替换也不报错
+    run = pptx_obj.get_label_runs(pptx_obj.presentation.slides[0], pptx_obj.label_index[
+        pptx_obj.presentation.slides[0].part], {"{student_number}": 1})[0]
+    run.text = "fixed"
+    pptx_obj.replace_data(0, {"{student_number}": 1})
+    assert counter[0] == 1
+    assert run.text == "fixed"
+
+    # 标签所在的图形都被删除，索引中的位置失效，重建索引
+    pptx_obj.delete_shapes(0)
+    pptx_obj.replace_data(0, {"{name0}": "zzz"})
+    assert counter[0] == 2
+    assert pptx_obj.label_index[pptx_obj.presentation.slides[0].part] == {}
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+import io
+import zipfile
+
+import pytest
+from pptx import Presentation
+
+import pptxtpl
+import pptx_package
+
+MEMBERS = [
+    ("stored.xml", b"<a>stored</a>" * 100, zipfile.ZIP_STORED),
+    ("deflated.xml", b"<a>deflated</a>" * 100, zipfile.ZIP_DEFLATED),
+    (u"ppt/media/图片.xml", u"<a>名称</a>".encode("utf-8") * 100, zipfile.ZIP_DEFLATED),
+    ("empty.xml", b"", zipfile.ZIP_DEFLATED),
+]
+
+
+class UnseekableStream(object):
+    """
+    只能顺序写的文件对象(比如 HTTP 响应)，zipfile 写入时在数据后面加数据描述符
+    """
+
+    def __init__(self):
+        self.stream = io.BytesIO()
+
+    def write(self, data):
+        return self.stream.write(data)
+
+    def flush(self):
+        pass
+
+
+def make_zip(stream):
+    with zipfile.ZipFile(stream, "w") as zip_file:
+        for name, data, compress_type in MEMBERS:
+            zip_file.writestr(name, data, compress_type)
+
+
+@pytest.mark.parametrize("seekable_source", [True, False])
+@pytest.mark.parametrize("seekable_dest", [True, False])
+def test_copy_raw_member(seekable_source, seekable_dest):
+    source = io.BytesIO() if seekable_source else UnseekableStream()
+    make_zip(source)
+    source_bytes = source.getvalue() if seekable_source else source.stream.getvalue()
+    source_infos = zipfile.ZipFile(io.BytesIO(source_bytes)).infolist()
+
+    dest = io.BytesIO() if seekable_dest else UnseekableStream()
+    with zipfile.ZipFile(dest, "w") as zip_file:
+        zip_file.writestr("first.xml", b"<first/>")
+        for info in source_infos:
+            pptx_package.copy_raw_member(zip_file, source_bytes, info)
+        pptx_package.copy_raw_member(zip_file, source_bytes, source_infos[1], "renamed.xml")
+        zip_file.writestr("last.xml", b"<last/>")
+
+    dest_bytes = dest.getvalue() if seekable_dest else dest.stream.getvalue()
+    with zipfile.ZipFile(io.BytesIO(dest_bytes)) as zip_file:
+        assert zip_file.testzip() is None
+        assert zip_file.namelist() == ["first.xml"] + [name for name, _, _ in MEMBERS] + ["renamed.xml", "last.xml"]
+        for name, data, compress_type in MEMBERS:
+            assert zip_file.read(name) == data
+            assert zip_file.getinfo(name).compress_type == compress_type
+        assert zip_file.read("renamed.xml") == MEMBERS[1][1]
+        assert zip_file.read("last.xml") == b"<last/>"
+
+
+def get_text(slide):
+    return "".join(slide.shapes._spTree.itertext())
+
+
+def test_incremental_save_copies_clean_parts(example_path):
+    compiled_template = pptxtpl.CompiledTemplate(example_path)
+    snapshot = compiled_template.package_snapshot
+    pptx_obj = compiled_template.new_template()
+    pptx_obj.replace_data(0, {"{name0}": "zzz"})
+    # 没有渲染的统计图页不序列化，直接复制快照中压缩好的数据
+    slide_part = pptx_obj.presentation.part.related_part(pptx_obj.xml_slides[1].rId)
+    assert slide_part in pptx_package.get_clean_parts(slide_part.package)
+    assert not pptx_package.is_part_touched(slide_part)
+
+    blob = pptx_obj.save()
+    with zipfile.ZipFile(io.BytesIO(blob)) as zip_file:
+        assert zip_file.testzip() is None
+        info = zip_file.getinfo(slide_part.partname.membername)
+        source_info = snapshot.infos[slide_part.partname.membername]
+        assert (info.date_time, info.CRC, info.compress_size) == \
+            (source_info.date_time, source_info.CRC, source_info.compress_size)
+
+    saved = Presentation(io.BytesIO(blob))
+    assert "zzz" in get_text(saved.slides[0])
+    assert saved.slides[1].shapes[0].has_chart
+
+
+def test_incremental_save_touched_part(example_path):
+    # 通过 python-pptx 修改、没有 mark_dirty 的 part 比较签名，修改不会丢失
+    pptx_obj = pptxtpl.CompiledTemplate(example_path).new_template()
+    pptx_obj.presentation.slides[1].shapes[0].name = "renamed chart"
+    saved = Presentation(io.BytesIO(pptx_obj.save()))
+    assert saved.slides[1].shapes[0].name == "renamed chart"
+
+
+def test_incremental_save_mark_dirty(example_path):
+    # 不经过 python-pptx 修改 xml 后 mark_dirty，保存时重新压缩
+    pptx_obj = pptxtpl.CompiledTemplate(example_path).new_template()
+    slide_part = pptx_obj.presentation.part.related_part(pptx_obj.xml_slides[1].rId)
+    c_nv_pr = slide_part._element.xpath("//p:graphicFrame/p:nvGraphicFramePr/p:cNvPr")[0]
+    c_nv_pr.set("name", "renamed chart")
+    pptx_package.mark_dirty(slide_part)
+    assert slide_part not in pptx_package.get_clean_parts(slide_part.package)
+
+    saved = Presentation(io.BytesIO(pptx_obj.save()))
+    assert saved.slides[1].shapes[0].name == "renamed chart"
+
+
+@pytest.mark.parametrize("compiled", [True, False])
+def test_incremental_save_renamed_slides(example_path, compiled):
+    # 模板中幻灯片的顺序与名称不一致，python-pptx 按顺序重新命名幻灯片，没有修改的幻灯片仍按原来的成员复制
+    pptx_obj = pptxtpl.PPTXTemplate(example_path)
+    pptx_obj.move_slide(1, 0)
+    template_blob = pptx_obj.save()
+    with zipfile.ZipFile(io.BytesIO(template_blob)) as zip_file:
+        assert b"c:chart" in zip_file.read("ppt/slides/slide2.xml")
+
+    if compiled:
+        pptx_obj = pptxtpl.CompiledTemplate(io.BytesIO(template_blob)).new_template()
+    else:
+        pptx_obj = pptxtpl.PPTXTemplate(io.BytesIO(template_blob), incremental_save=True)
+    pptx_obj.replace_data(1, {"{name0}": "zzz"})
+    blob = pptx_obj.save()
+
+    with zipfile.ZipFile(io.BytesIO(blob)) as zip_file:
+        assert b"c:chart" in zip_file.read("ppt/slides/slide1.xml")
+    saved = Presentation(io.BytesIO(blob))
+    assert [shape.has_chart for shape in saved.slides[0].shapes] == [True]
+    assert "zzz" in get_text(saved.slides[1])
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+import os
+
+import pytest
+from pptx import Presentation
+
+import inventory
+import render_batch
+
+
+def render(example_path, records, out_dir, workers=1, validate=True):
+    template_inventory = inventory.build_inventory(example_path) if validate else None
+    results = render_batch.render_many(example_path, records, str(out_dir), workers=workers,
+                                       template_inventory=template_inventory)
+    return dict((result.index, result) for result in results)
+
+
+def get_replace_data():
+    return {"{name0}": "zzz", "{age0}": 90, "{name1}": "wb", "{age1}": 45, "{name2}": "zb", "{age2}": 18,
+            "{student_number}": 3}
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_render_many(example_path, tmp_path, workers):
+    records = [{"name": "a.pptx", "slides": [{"index": 0, "replace_data": get_replace_data()}]},
+               {"slides": [{"index": 0, "replace_data": get_replace_data()}]}]
+    results = render(example_path, records, tmp_path, workers)
+
+    assert [results[i].error for i in range(2)] == [None, None]
+    assert results[0].path == os.path.join(str(tmp_path), "a.pptx")
+    assert results[1].name == "1.pptx"
+    text = "".join(Presentation(results[0].path).slides[0].shapes._spTree.itertext())
+    assert "zzz" in text and "{name0}" not in text
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_render_many_isolates_bad_records(example_path, tmp_path, workers):
+    good = {"slides": [{"index": 0, "replace_data": get_replace_data()}]}
+    records = [
+        "not a record",
+        dict(good, name="../escape.pptx"),
+        dict(good, name=os.path.join(str(tmp_path), "abs.pptx")),
+        dict(good, name="same.pptx"),
+        dict(good, name="same.pptx"),
+        {"name": "table.pptx", "slides": [{"index": 0, "table_data": [1, 2]}]},
+        {"name": "slides.pptx", "slides": "x"},
+        {"name": "index.pptx", "slides": [{"index": 9}]},
+        dict(good, name="last.pptx"),
+    ]
+    results = render(example_path, records, tmp_path, workers)
+
+    assert len(results) == len(records)
+    failed = sorted(index for index, result in results.items() if result.error)
+    assert failed == [0, 1, 2, 4, 5, 6, 7]
+    assert "duplicate record name" in results[4].error
+    assert "invalid record name" in results[1].error
+    for index in (3, 8):
+        assert os.path.exists(results[index].path)
+    assert not os.path.exists(os.path.join(os.path.dirname(str(tmp_path)), "escape.pptx"))
+    assert not os.path.exists(os.path.join(str(tmp_path), "abs.pptx"))
+
+
+def test_render_many_render_error(example_path, tmp_path):
+    # 不校验时，渲染中的异常同样只影响这一条记录
+    records = [{"name": "bad.pptx", "slides": [{"index": 9, "replace_data": {}}]},
+               {"name": "good.pptx", "slides": [{"index": 0, "replace_data": get_replace_data()}]}]
+    results = render(example_path, records, tmp_path, validate=False)
+    assert "IndexError" in results[0].error
+    assert results[1].error is None
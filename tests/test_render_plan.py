@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+import io
+
+import pytest
+from pptx.util import Inches
+
+import pptxtpl
+import inventory
+
+CONTEXT = {"students": [{"name": "zzz", "age": 90}, {"name": "wb", "age": 45}], "show": False}
+
+
+def make_template(example_path, lines, name="blocks"):
+    """
+    example.pptx 第0页加一个文本框，每行一个段落
+    :return: 模板的 bytes
+    """
+    pptx_obj = pptxtpl.PPTXTemplate(example_path)
+    shape = pptx_obj.presentation.slides[0].shapes.add_textbox(0, 0, Inches(4), Inches(4))
+    shape.name = name
+    shape.text_frame.text = "\n".join(lines)
+    return pptx_obj.save()
+
+
+def get_lines(pptx_obj, index=0, name="blocks"):
+    for shape in pptx_obj.presentation.slides[index].shapes:
+        if shape.name == name:
+            return [p.text for p in shape.text_frame.paragraphs]
+    raise KeyError(name)
+
+
+BLOCK_LINES = ["{%for student in students%}", "{student.name}: {student.age}", "{%endfor%}",
+               "{%if show%}", "shown {student_number}", "{%else%}", "hidden", "{%endif%}"]
+SPACED_LINES = ["{% for student in students %}", "{student.name}: {student.age}", "{% endfor %}",
+                "{% if show %}", "shown {student_number}", "{% else %}", "hidden", "{% endif %}"]
+
+
+@pytest.mark.parametrize("lines", [BLOCK_LINES, SPACED_LINES])
+def test_render_blocks(example_path, lines):
+    pptx_obj = pptxtpl.PPTXTemplate(io.BytesIO(make_template(example_path, lines)))
+    pptx_obj.render_blocks(0, CONTEXT)
+    assert get_lines(pptx_obj) == ["zzz: 90", "wb: 45", "hidden"]
+
+
+def test_render_blocks_compiled_instances(example_path):
+    compiled_template = pptxtpl.CompiledTemplate(io.BytesIO(make_template(example_path, BLOCK_LINES)))
+    first = compiled_template.new_template()
+    first.render_blocks(0, CONTEXT)
+    second = compiled_template.new_template()
+    second.render_blocks(0, {"students": [], "show": True})
+    second.replace_data(0, {"{student_number}": 0})
+
+    assert get_lines(first) == ["zzz: 90", "wb: 45", "hidden"]
+    assert get_lines(second) == ["shown 0"]
+    # 模板本身不被渲染实例修改
+    assert get_lines(compiled_template.new_template()) == BLOCK_LINES
+
+
+def test_block_tags_are_not_labels(example_path):
+    # 不带空格的块标记也符合标签格式 {%s}，不能出现在标签索引和模板清单中
+    template_blob = make_template(example_path, BLOCK_LINES)
+    pptx_obj = pptxtpl.PPTXTemplate(io.BytesIO(template_blob))
+    labels = set(pptx_obj.build_slide_label_index(pptx_obj.presentation.slides[0]))
+    assert not [label for label in labels if label.startswith("{%")]
+    assert "{student_number}" in labels
+
+    template_inventory = inventory.build_inventory(template_blob)
+    slide = template_inventory["slides"][0]
+    assert not [item for item in slide["labels"] if item["label"].startswith("{%")]
+    assert {"{student.name}", "{student.age}", "{student_number}"} <= set(slide["block_labels"])
+
+    data = {"{name0}": "zzz", "{age0}": 90, "{name1}": "wb", "{age1}": 45, "{name2}": "zb", "{age2}": 18}
+    record = {"slides": [{"index": 0, "context": CONTEXT, "replace_data": data}]}
+    assert inventory.validate_record(template_inventory, record) == []
+
+
+def test_plain_text_starting_with_block_flag(example_path):
+    lines = ["{%} growth", "{%rate}"]
+    template_blob = make_template(example_path, lines)
+    compiled_template = pptxtpl.CompiledTemplate(io.BytesIO(template_blob))
+    inventory.build_inventory(template_blob)
+
+    pptx_obj = compiled_template.new_template()
+    pptx_obj.render_blocks(0, CONTEXT)
+    assert get_lines(pptx_obj) == lines
+
+
+@pytest.mark.parametrize("lines, error", [
+    (["{% if a b %}", "x", "{% endif %}"], "invalid block tag"),
+    (["{% for x in xs %}", "x"], "is not closed"),
+    (["x", "{% endfor %}"], "unexpected"),
+])
+def test_malformed_blocks_raise_on_render(example_path, lines, error):
+    template_blob = make_template(example_path, lines)
+    # 编译模板、建立清单时不报错，渲染这一页时才报错
+    compiled_template = pptxtpl.CompiledTemplate(io.BytesIO(template_blob))
+    inventory.build_inventory(template_blob)
+
+    pptx_obj = compiled_template.new_template()
+    pptx_obj.render_blocks(1, CONTEXT)
+    with pytest.raises(ValueError, match=error):
+        pptx_obj.render_blocks(0, CONTEXT)
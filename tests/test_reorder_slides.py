@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+import io
+
+import pytest
+from pptx import Presentation
+from pptx.util import Inches
+
+import pptxtpl
+from conftest import open_saved
+
+
+def make_template(example_path, count=5):
+    """
+    example.pptx(第1页是统计图)后面追加空白幻灯片，每页放一个写着 slide<i> 的文本框
+    """
+    pptx_obj = pptxtpl.PPTXTemplate(example_path)
+    while len(pptx_obj.presentation.slides) < count:
+        pptx_obj.add_blank_slide()
+    for i, slide in enumerate(pptx_obj.presentation.slides):
+        slide.shapes.add_textbox(0, 0, Inches(1), Inches(1)).text_frame.text = "slide%d" % i
+    return pptx_obj
+
+
+def get_names(presentation):
+    names = []
+    for slide in presentation.slides:
+        texts = [shape.text_frame.text for shape in slide.shapes if shape.has_text_frame]
+        names.append([text for text in texts if text.startswith("slide")][0])
+    return names
+
+
+def test_reorder_slides(example_path):
+    pptx_obj = make_template(example_path)
+    pptx_obj.reorder_slides([4, 0, 1, 3, 2])
+    assert get_names(pptx_obj.presentation) == ["slide4", "slide0", "slide1", "slide3", "slide2"]
+    saved = Presentation(io.BytesIO(pptx_obj.save()))
+    assert get_names(saved) == ["slide4", "slide0", "slide1", "slide3", "slide2"]
+
+
+def test_reorder_slides_deletes_unlisted_parts(example_path):
+    pptx_obj = make_template(example_path)
+    pptx_obj.reorder_slides([3, 0])
+    assert get_names(pptx_obj.presentation) == ["slide3", "slide0"]
+
+    names = open_saved(pptx_obj).namelist()
+    assert len([name for name in names if name.startswith("ppt/slides/slide")]) == 2
+    # 第1页的统计图和内嵌 xlsx 只被被删除的幻灯片使用
+    assert not [name for name in names if name.startswith(("ppt/charts/chart", "ppt/embeddings/"))]
+    assert len(names) == len(set(names))
+
+
+def test_reorder_slides_negative_indexes(example_path):
+    pptx_obj = make_template(example_path)
+    pptx_obj.reorder_slides([-1, 0, -2])
+    assert get_names(pptx_obj.presentation) == ["slide4", "slide0", "slide3"]
+
+
+def test_reorder_slides_duplicate_index(example_path):
+    pptx_obj = make_template(example_path)
+    with pytest.raises(ValueError):
+        pptx_obj.reorder_slides([0, 1, 1])
+    # -1 与 4 是同一页
+    with pytest.raises(ValueError):
+        pptx_obj.reorder_slides([4, -1])
+    # 出错时不修改幻灯片
+    assert get_names(pptx_obj.presentation) == ["slide0", "slide1", "slide2", "slide3", "slide4"]
+
+
+def test_keep_slides(example_path):
+    pptx_obj = make_template(example_path)
+    pptx_obj.keep_slides([4, 1, -3])
+    assert get_names(pptx_obj.presentation) == ["slide1", "slide2", "slide4"]
+
+    names = open_saved(pptx_obj).namelist()
+    assert len([name for name in names if name.startswith("ppt/slides/slide")]) == 3
+    assert [name for name in names if name.startswith("ppt/charts/chart")]
+
+
+def test_keep_slides_duplicate_index(example_path):
+    # keep_slides 只是选出要保留的幻灯片，重复的索引没有影响
+    pptx_obj = make_template(example_path)
+    pptx_obj.keep_slides([2, 2, -3])
+    assert get_names(pptx_obj.presentation) == ["slide2"]
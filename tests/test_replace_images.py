@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+import io
+
+import pytest
+from pptx import Presentation
+from pptx.util import Inches
+
+import pptxtpl
+import image_cache
+from conftest import open_saved
+
+PILImage = pytest.importorskip("PIL.Image")
+
+SHAPE_SIZE = (Inches(2), Inches(1))
+
+
+def make_image(size, image_format="PNG", seed=32):
+    image = PILImage.effect_noise(size, seed).convert("RGB")
+    image_stream = io.BytesIO()
+    image.save(image_stream, image_format)
+    return image_stream.getvalue()
+
+
+def make_template(example_path):
+    """
+    example.pptx 第0页加一个文本是 {photo} 的文本框、一张替代文字是 {logo} 的图片
+    :return: 模板的 bytes
+    """
+    pptx_obj = pptxtpl.PPTXTemplate(example_path)
+    shapes = pptx_obj.presentation.slides[0].shapes
+    textbox = shapes.add_textbox(Inches(1), Inches(1), *SHAPE_SIZE)
+    textbox.name = "photo box"
+    textbox.text_frame.text = "{photo}"
+    picture = shapes.add_picture(io.BytesIO(make_image((20, 10), seed=1)), Inches(4), Inches(1), *SHAPE_SIZE)
+    picture.name = "logo"
+    picture._element.nvPicPr.cNvPr.set("descr", "{logo}")
+    return pptx_obj.save()
+
+
+def get_pictures(slide):
+    return [shape for shape in slide.shapes if shape.shape_type == 13]
+
+
+def get_media_names(zip_file):
+    return [name for name in zip_file.namelist() if name.startswith("ppt/media/")]
+
+
+def test_replace_images(example_path):
+    pptx_obj = pptxtpl.PPTXTemplate(io.BytesIO(make_template(example_path)))
+    old_image = pptx_obj.presentation.slides[0].shapes[-1].image.blob
+    photo = make_image((2000, 1000), "JPEG")
+    logo = make_image((40, 20), seed=2)
+    cache = image_cache.ImageCache()
+    assert pptx_obj.replace_images(0, {"{photo}": photo, "{logo}": logo}, cache=cache) == 2
+
+    zip_file = open_saved(pptx_obj)
+    # 原来的图片不再被引用，不再输出
+    media_blobs = [zip_file.read(name) for name in get_media_names(zip_file)]
+    assert len(media_blobs) == 2 and old_image not in media_blobs
+    saved = Presentation(io.BytesIO(pptx_obj.save()))
+    pictures = get_pictures(saved.slides[0])
+    assert [picture.name for picture in pictures] == ["photo box", "logo"]
+    photo_picture, logo_picture = pictures
+    assert (photo_picture.left, photo_picture.top, photo_picture.width, photo_picture.height) == \
+        (Inches(1), Inches(1)) + SHAPE_SIZE
+    assert (logo_picture.left, logo_picture.width) == (Inches(4), SHAPE_SIZE[0])
+    # 大图按 150 dpi 缩小到 300x150，小图原样保存
+    assert photo_picture.image.size == (300, 150)
+    assert photo_picture.image.content_type == "image/jpeg"
+    assert logo_picture.image.blob == logo
+    assert "{photo}" not in "".join(saved.slides[0].shapes._spTree.itertext())
+
+
+def test_replace_images_crop_to_fit(example_path):
+    pptx_obj = pptxtpl.PPTXTemplate(io.BytesIO(make_template(example_path)))
+    # 正方形的图片填满 2:1 的图形，上下各裁掉 1/4
+    pptx_obj.replace_images(0, {"{photo}": make_image((100, 100))}, dpi=None, cache=image_cache.ImageCache())
+    picture = get_pictures(pptx_obj.presentation.slides[0])[0]
+    assert picture.image.size == (100, 100)
+    assert (picture.crop_left, picture.crop_right) == (0, 0)
+    assert picture.crop_top == pytest.approx(0.25)
+    assert picture.crop_bottom == pytest.approx(0.25)
+
+
+def test_replace_images_same_image(example_path):
+    # 同一张图片在一份演示文稿中只保存一次，在缓存中只处理一次
+    pptx_obj = pptxtpl.PPTXTemplate(io.BytesIO(make_template(example_path)))
+    old_count = len(get_media_names(open_saved(pptx_obj)))
+    image = make_image((40, 20), seed=3)
+    cache = image_cache.ImageCache()
+    pptx_obj.replace_images(0, {"{photo}": image, "{logo}": image}, dpi=None, cache=cache)
+    assert len(cache) == 1
+
+    pictures = get_pictures(pptx_obj.presentation.slides[0])
+    assert pictures[0].image.sha1 == pictures[1].image.sha1
+    assert len(get_media_names(open_saved(pptx_obj))) == old_count
+
+
+@pytest.mark.parametrize("incremental_save", [False, True])
+def test_replace_images_compiled_instances(example_path, incremental_save):
+    compiled_template = pptxtpl.CompiledTemplate(io.BytesIO(make_template(example_path)),
+                                                 incremental_save=incremental_save)
+    cache = image_cache.ImageCache()
+    images = [make_image((40, 20), seed=seed) for seed in (4, 5)]
+    blobs = []
+    for image in images:
+        pptx_obj = compiled_template.new_template()
+        assert pptx_obj.replace_images(0, {"{photo}": image}, cache=cache) == 1
+        blobs.append(pptx_obj.save())
+
+    for image, blob in zip(images, blobs):
+        saved = Presentation(io.BytesIO(blob))
+        assert get_pictures(saved.slides[0])[0].image.blob == image
+    # 模板不受渲染实例影响
+    pptx_obj = compiled_template.new_template()
+    assert [picture.name for picture in get_pictures(pptx_obj.presentation.slides[0])] == ["logo"]
+
+
+def test_replace_images_missing_labels(example_path):
+    pptx_obj = pptxtpl.PPTXTemplate(io.BytesIO(make_template(example_path)))
+    # data 中没有的标签、幻灯片上没有的标签都不替换
+    assert pptx_obj.replace_images(0, {"{other}": make_image((40, 20))}) == 0
+    assert pptx_obj.replace_images(1, {"{photo}": make_image((40, 20))}) == 0
+    assert [picture.name for picture in get_pictures(pptx_obj.presentation.slides[0])] == ["logo"]
+
+
+def test_replace_images_invalid_image(example_path):
+    pptx_obj = pptxtpl.PPTXTemplate(io.BytesIO(make_template(example_path)))
+    with pytest.raises(IOError):
+        pptx_obj.replace_images(0, {"{photo}": b"not an image"}, cache=image_cache.ImageCache())
@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+"""
+直接在幻灯片 spTree 的 lxml 元素上渲染，不创建 python-pptx 的 shape/paragraph/run 代理对象
+
+图形的范围与 PPTXTemplate.get_slide_single_shapes 一致：幻灯片上的图形以及组合图形(任意层嵌套)中的子图形
+"""
+from lxml import etree
+from pptx.oxml.ns import namespaces, qn
+
+
+NAMESPACES = namespaces("a", "p", "r", "c")
+
+# 直接用 find/findall 比 python-pptx 元素类上的属性快得多
+TAG_SP = qn("p:sp")
+TAG_PIC = qn("p:pic")
+TAG_TX_BODY = qn("p:txBody")
+TAG_P = qn("a:p")
+TAG_R = qn("a:r")
+TAG_T = qn("a:t")
+
+# spTree 或组合图形(任意层嵌套)的直接子元素，与 python-pptx 的 slide.shapes、group.shapes 范围相同
+_IN_SHAPE_TREE = "parent::p:spTree or parent::p:grpSp"
+
+TEXT_BODY_XPATH = etree.XPath(".//p:sp[%s]/p:txBody" % _IN_SHAPE_TREE, namespaces=NAMESPACES)
+
+# 含有 $flag(替换标签的左边符号)的文本节点，筛选在 libxml2 中完成
+FLAG_TEXT_XPATH = etree.XPath(".//p:sp[%s]/p:txBody/a:p/a:r/a:t[contains(., $flag)]" % _IN_SHAPE_TREE,
+                              namespaces=NAMESPACES)
+
+# 与 python-pptx 中 slide.shapes 包含的元素相同
+_SHAPE_TAGS = "self::p:sp or self::p:graphicFrame or self::p:cxnSp or self::p:pic or self::p:contentPart"
+
+SINGLE_SHAPE_XPATH = etree.XPath(".//*[(%s) and (%s)]" % (_IN_SHAPE_TREE, _SHAPE_TAGS), namespaces=NAMESPACES)
+
+# 图形自身或其中(组合图形)的文本框、统计图
+_SELF_TEXT_BODY = "descendant-or-self::p:sp[%s]/p:txBody" % _IN_SHAPE_TREE
+_SELF_CHART = "descendant-or-self::p:graphicFrame[%s]/a:graphic/a:graphicData/c:chart" % _IN_SHAPE_TREE
+
+SELF_PARAGRAPH_XPATH = etree.XPath(_SELF_TEXT_BODY + "/a:p", namespaces=NAMESPACES)
+RUN_TEXT_XPATH = etree.XPath("a:r/a:t/text()", namespaces=NAMESPACES)
+SELF_CHART_XPATH = etree.XPath(_SELF_CHART, namespaces=NAMESPACES)
+
+# spTree 中可能需要删除的顶层图形：文本中含有 $flag，或者含有统计图(标题需要另外检查)
+PRUNE_CANDIDATE_XPATH = etree.XPath("*[%s/a:p/a:r/a:t[contains(., $flag)] or %s]" % (_SELF_TEXT_BODY, _SELF_CHART),
+                                    namespaces=NAMESPACES)
+
+CHART_TITLE_PARAGRAPH_XPATH = etree.XPath("c:chart/c:title/c:tx/c:rich/a:p", namespaces=NAMESPACES)
+
+ATTR_R_ID = qn("r:id")
+TAG_EXT_LST = qn("p:extLst")
+
+# 带有 r:embed、r:link、r:id 等关系引用的元素
+REL_REFERENCE_XPATH = etree.XPath("descendant-or-self::*[@r:*]", namespaces=NAMESPACES)
+R_NAMESPACE_PREFIX = "{%s}" % NAMESPACES["r"]
+
+
+def get_single_shape_elements(sp_tree):
+    """
+    获取 spTree 中的所有图形元素，组合图形展开成子图形，等价于 get_slide_single_shapes
+    :param sp_tree:
+    :return: [element]
+    """
+    return SINGLE_SHAPE_XPATH(sp_tree)
+
+
+def get_text_bodies(sp_tree):
+    """
+    获取 spTree 中所有文本框的 p:txBody 元素
+    :param sp_tree:
+    :return: [txBody]
+    """
+    return TEXT_BODY_XPATH(sp_tree)
+
+
+def get_prune_candidates(sp_tree, flag):
+    """
+    获取 spTree 中文本含有 flag 或者含有统计图的顶层图形元素，见 PPTXTemplate.get_label_shape_elements
+    :param sp_tree:
+    :param flag: 替换标签的左边符号，比如 {
+    :return: [element]
+    """
+    return PRUNE_CANDIDATE_XPATH(sp_tree, flag=flag)
+
+
+def get_shape_paragraph_texts(element):
+    """
+    图形及其中(组合图形)所有文本框的每个段落的文本
+    替换标签不会跨段落(标签中不能有空白字符)，检查标签时逐段落检查即可
+    :return: [text]
+    """
+    return ["".join(RUN_TEXT_XPATH(p)) for p in SELF_PARAGRAPH_XPATH(element)]
+
+
+def get_chart_rids(element):
+    """
+    图形及其中(组合图形)的统计图指向统计图part的 rId
+    :return: [rId]
+    """
+    return [c_chart.get(ATTR_R_ID) for c_chart in SELF_CHART_XPATH(element)]
+
+
+def get_chart_title(chart_space):
+    """
+    统计图标题的文本，没有标题时为空字符串
+    不使用 chart.chart_title：它会给没有标题的统计图添加标题元素
+    :param chart_space: 统计图的 c:chartSpace 元素，即 chart_part._element
+    :return:
+    """
+    return "\n".join(get_paragraph_text(p) for p in CHART_TITLE_PARAGRAPH_XPATH(chart_space))
+
+
+def iter_rel_references(element):
+    """
+    element 及其子孙元素中引用关系的属性
+    :return: 生成器 (元素, 属性名, rId)
+    """
+    for el in REL_REFERENCE_XPATH(element):
+        for key, rId in el.attrib.items():
+            if key.startswith(R_NAMESPACE_PREFIX):
+                yield el, key, rId
+
+
+def insert_shape_element(sp_tree, element):
+    """
+    把图形元素添加到 spTree(或 grpSp) 的末尾，p:extLst 之前
+    与 insert_element_before(element, "p:extLst") 相同，但不执行 XPath
+    """
+    ext_lst = sp_tree.find(TAG_EXT_LST)
+    if ext_lst is None:
+        sp_tree.append(element)
+    else:
+        ext_lst.addprevious(element)
+
+
+def get_flag_text_nodes(sp_tree, flag):
+    """
+    获取 spTree 中含有 flag 的 a:t 元素
+    :param sp_tree:
+    :param flag: 替换标签的左边符号，比如 {
+    :return: [a:t]
+    """
+    return FLAG_TEXT_XPATH(sp_tree, flag=flag)
+
+
+def get_run(sp_tree, shape_path, paragraph_index, run_index):
+    """
+    根据位置找到 a:r 元素，位置不存在时返回 None
+    :param sp_tree:
+    :param shape_path: 图形在 spTree 中的路径，见 PPTXTemplate.get_shape_path
+    :param paragraph_index: 段落序号
+    :param run_index: run 序号
+    :return: a:r
+    """
+    element = sp_tree
+    try:
+        for i in shape_path:
+            element = element[i]
+        return element.find(TAG_TX_BODY).findall(TAG_P)[paragraph_index].findall(TAG_R)[run_index]
+    except (AttributeError, IndexError):
+        return None
+
+
+def get_run_text(r):
+    """
+    run 的文本，与 r.text 相同
+    """
+    text = r.find(TAG_T).text
+    return text if text is not None else ""
+
+
+def get_paragraph_text(p):
+    """
+    段落中所有 run 的文本拼接，与 paragraph.runs 的文本一致
+    """
+    return "".join(get_run_text(r) for r in p.findall(TAG_R))